@@ -0,0 +1,3 @@
+# Description: Library of the Part 1 Crime Data app, used by the Streamlit app (myapp.py) and headless scripts alike.
+# Nothing is imported here, so importing one module (e.g. crime_data.data_cache) only loads what that module needs;
+# Streamlit and the map libraries are only imported by crime_data.visualizing_data and crime_data.crime_map.
@@ -0,0 +1,180 @@
+# Description: This file contains the headless batch run that precomputes everything the app shows.
+# It cleans the raw data into the cache directory (the cleaned data, cube, grid, heatmap bins and trend counts the app loads, and the
+# memory-mapped copy of the cleaned data the app processes share), and writes
+# artifacts next to it: the Description counts and the monthly crime counts and crime mix of the whole data and
+# of every date window, and the rendered marker map of every window and crime type. An index records the version
+# of the cleaned data they were made from, the app only uses artifacts of the data it has loaded. No Streamlit
+# is needed, e.g. python -m crime_data.batch --years --window 2014-01-01:2015-01-01
+
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+
+from crime_data.cleaning_data import RAW_DATA_PATH
+from crime_data.crime_cube import count_by, query_crime_cube, roll_up
+from crime_data.crime_stats import filter_date_range, get_crime_percents
+from crime_data.data_cache import CACHE_DIR, cleaned_data_version, load_cleaned_data, load_crime_cube, load_heat_bins, load_spatial_grid, load_trend_counts, temporary_path, write_parquet_file
+from crime_data.profiling import configure_profile_log, finish_run, profiled, start_run
+from crime_data.shared_store import publish_shared_data
+
+# Directory of the artifacts inside the cache directory, and the name of their index
+ARTIFACTS_DIR = "artifacts"
+ARTIFACTS_INDEX = "index.json"
+
+# Function to return the directory of the artifacts
+def artifacts_path(cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, ARTIFACTS_DIR)
+
+# Function to read the index of the artifacts, returns an empty dict if there is none
+def read_artifact_index(cache_dir=CACHE_DIR):
+    try:
+        with open(os.path.join(artifacts_path(cache_dir), ARTIFACTS_INDEX), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+# Function to write the index of the artifacts atomically
+def write_artifact_index(index, cache_dir=CACHE_DIR):
+    index_path = os.path.join(artifacts_path(cache_dir), ARTIFACTS_INDEX)
+    with open(temporary_path(index_path), 'w', encoding='utf-8') as f:
+        json.dump(index, f, indent=2)
+    os.replace(temporary_path(index_path), index_path)
+
+# Function to return the key of a date window, e.g. '2014-01-01:2015-01-01'
+def window_key(from_date, to_date):
+    return '%s:%s' % (pd.Timestamp(from_date).date(), pd.Timestamp(to_date).date())
+
+# Function to return the entry of a date window in the index, None when the artifacts are missing or made from other data
+def find_window(from_date, to_date, data_version, cache_dir=CACHE_DIR):
+    index = read_artifact_index(cache_dir)
+    if index.get('data_version') != data_version:
+        return None
+    return index.get('windows', {}).get(window_key(from_date, to_date))
+
+# Function to return the 'description_counts', 'crime_counts' and 'crime_mix' tables of a date window, None when they were not precomputed
+def read_window_tables(from_date, to_date, data_version, cache_dir=CACHE_DIR):
+    window = find_window(from_date, to_date, data_version, cache_dir)
+    if window is None:
+        return None
+    directory = artifacts_path(cache_dir)
+    description_counts = pd.read_parquet(os.path.join(directory, window['description_counts']))['count']
+    crime_counts = pd.read_parquet(os.path.join(directory, window['crime_counts']))
+    crime_mix = pd.read_parquet(os.path.join(directory, window['crime_mix']))
+    return description_counts, crime_counts, crime_mix
+
+# Function to return the rendered marker map of a date window and crime type, None when it was not precomputed
+def read_map_artifact(from_date, to_date, crime, data_version, cache_dir=CACHE_DIR):
+    window = find_window(from_date, to_date, data_version, cache_dir)
+    if window is None or crime not in window.get('maps', {}):
+        return None
+    with open(os.path.join(artifacts_path(cache_dir), window['maps'][crime]), 'r', encoding='utf-8') as f:
+        return f.read()
+
+# Function to write the Description counts, monthly crime counts and crime mix of cube cells, returns their file names
+def write_tables(cells, directory, prefix=''):
+    crime_counts = roll_up(cells, 'MS')
+    tables = {
+        'description_counts': count_by(cells, 'Description').rename('count').to_frame(),
+        'crime_counts': crime_counts,
+        'crime_mix': get_crime_percents(crime_counts),
+    }
+    files = {}
+    for name, table in tables.items():
+        files[name] = prefix + name + '.parquet'
+        write_parquet_file(table, os.path.join(directory, files[name]))
+    return files
+
+# Function to write the artifacts of the cleaned data in the cache directory
+# windows is a list of (from_date, to_date), crimes a list of crime types or None for all of them
+def write_artifacts(cleaned_data, crime_cube, windows, crimes=None, cache_dir=CACHE_DIR, maps=True):
+    # imported here so the tables can be written without the map libraries
+    from crime_data.crime_map import build_crime_map, render_map
+
+    directory = artifacts_path(cache_dir)
+    os.makedirs(directory, exist_ok=True)
+    if crimes is None:
+        crimes = [str(crime) for crime in cleaned_data['Description'].cat.categories]
+
+    index = {'data_version': cleaned_data_version(cache_dir), 'created': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+    index['all'] = profiled('write_tables', write_tables, crime_cube, directory)
+
+    index['windows'] = {}
+    for number, (from_date, to_date) in enumerate(windows):
+        key = window_key(from_date, to_date)
+        cells = query_crime_cube(crime_cube, from_date, to_date)
+        window = {'from_date': key.split(':')[0], 'to_date': key.split(':')[1]}
+        window.update(profiled('write_tables', write_tables, cells, directory, 'window_%d_' % number))
+
+        window['maps'] = {}
+        if maps:
+            data = filter_date_range(cleaned_data, from_date, to_date)
+            for crime_number, crime in enumerate(crimes):
+                file_name = 'window_%d_map_%d.html' % (number, crime_number)
+                html = profiled('build_crime_map', lambda: render_map(build_crime_map(data, crime)))
+                map_path = os.path.join(directory, file_name)
+                with open(temporary_path(map_path), 'w', encoding='utf-8') as f:
+                    f.write(html)
+                os.replace(temporary_path(map_path), map_path)
+                window['maps'][crime] = file_name
+        index['windows'][key] = window
+
+    # the index is written last, so the app never finds an index pointing to missing files
+    write_artifact_index(index, cache_dir)
+    return index
+
+# Function to return a window per calendar year of the cleaned data, as (from_date, to_date)
+def year_windows(cleaned_data):
+    if not len(cleaned_data):
+        return []
+    first, last = cleaned_data['CrimeDateTime'].iloc[0].year, cleaned_data['CrimeDateTime'].iloc[-1].year
+    return [('%d-01-01' % year, '%d-01-01' % (year + 1)) for year in range(first, last + 1)]
+
+# Function to parse a 'from:to' window argument, e.g. '2014-01-01:2015-01-01'
+def parse_window(text):
+    from_date, _, to_date = text.partition(':')
+    try:
+        return pd.Timestamp(from_date).date().isoformat(), pd.Timestamp(to_date).date().isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError("a window is written as FROM:TO, e.g. 2014-01-01:2015-01-01")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompute the cleaned data, aggregates and maps of the crime data app")
+    parser.add_argument('path', nargs='?', default=RAW_DATA_PATH)
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="directory the app loads from, set CRIME_DATA_CACHE_DIR to the same directory")
+    parser.add_argument('--window', type=parse_window, action='append', default=[], help="date window FROM:TO, can be repeated")
+    parser.add_argument('--years', action='store_true', help="add a window per calendar year of the data")
+    parser.add_argument('--crime', action='append', help="crime type to render maps for, can be repeated, all by default")
+    parser.add_argument('--no-maps', action='store_true', help="only write the tables")
+    parser.add_argument('--workers', type=int, help="clean the raw data in this many processes")
+    parser.add_argument('--incremental', action='store_true', help="only clean the new and changed rows of the raw data")
+    parser.add_argument('--sql-store', action='store_true', help="also copy the cleaned data into the SQLite file of python -m crime_data.sql_store")
+    parser.add_argument('--profile-log', help="file to write the JSON log of every stage to")
+    args = parser.parse_args()
+
+    if args.profile_log:
+        configure_profile_log(args.profile_log)
+    start_run('batch')
+    start = time.perf_counter()
+
+    cleaned_data = load_cleaned_data(args.path, args.cache_dir, streaming=not args.workers, workers=args.workers, incremental=args.incremental)
+    crime_cube = load_crime_cube(cleaned_data, args.cache_dir)
+    load_spatial_grid(cleaned_data, args.cache_dir)
+    load_heat_bins(cleaned_data, args.cache_dir)
+    load_trend_counts(cleaned_data, args.cache_dir)
+    # the app processes map the published version instead of each reading the cleaned data
+    profiled('publish_shared_data', publish_shared_data, cleaned_data, cleaned_data_version(args.cache_dir), args.cache_dir)
+    if args.sql_store:
+        # imported here because the SQL store is optional
+        from crime_data.sql_store import build_sql_store
+        profiled('build_sql_store', build_sql_store, args.cache_dir)
+
+    windows = list(dict.fromkeys(args.window + (year_windows(cleaned_data) if args.years else [])))
+    index = write_artifacts(cleaned_data, crime_cube, windows, args.crime, args.cache_dir, maps=not args.no_maps)
+
+    finish_run()
+    maps = sum(len(window['maps']) for window in index['windows'].values())
+    print(f"wrote {len(cleaned_data)} cleaned rows, {len(index['windows'])} windows and {maps} maps "
+          f"to {args.cache_dir} in {time.perf_counter() - start:.2f} seconds")
@@ -0,0 +1,162 @@
+# Description: This file contains the benchmark of every stage of the data pipeline.
+# Each stage runs on the output of the one before it, is timed (the best of a few runs) and then run once more
+# under tracemalloc for the peak memory it allocates. The results are written as JSON, and a result can be
+# compared with an earlier one to find the stages that got slower or use more memory, e.g.
+# python -m crime_data.synthetic_data 1m raw_1m.csv
+# python -m crime_data.benchmark raw_1m.csv --output after.json --compare before.json
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from crime_data.cleaning_data import clean_chunk, clean_column, drop_invalid_rows, focused_data, load_data, sort_by_crime_date_time
+from crime_data.cleaning_rules import CLEANING_RULES
+from crime_data.crime_stats import filter_date_range, get_crime_counts, get_crime_percents
+
+# Date range of the date filter stage, the default range of the app
+FROM_DATE = '2014-01-01'
+TO_DATE = '2015-01-01'
+
+# A stage is reported as a regression when it is this much slower or uses this much more memory than before
+REGRESSION_THRESHOLD = 0.2
+
+# Stages that got slower by less than this many seconds are not reported, their timings are mostly noise
+MIN_REGRESSION_SECONDS = 0.05
+
+# Function to build the map of the filtered crimes and render it to HTML like the app does
+def build_map(data):
+    # imported here so the other stages can be benchmarked without the map libraries
+    from crime_data.crime_map import build_crime_map, render_map
+    return render_map(build_crime_map(data, data['Description'].iloc[0] if len(data) else None))
+
+# Function to return the stages of the pipeline as (name, input, function)
+# input is the name of the stage whose output the function is called on, None for the path of the raw data
+def pipeline_stages(from_date=FROM_DATE, to_date=TO_DATE):
+    return [
+        ('load', None, load_data),
+        ('focus', 'load', focused_data),
+        ('drop_invalid_rows', 'focus', drop_invalid_rows),
+    ] + [
+        # one stage per column with cleaning rules
+        ('clean_%s' % column, 'drop_invalid_rows', lambda data, column=column: clean_column(data[column]))
+        for column in CLEANING_RULES['columns']
+    ] + [
+        ('clean_chunk', 'focus', clean_chunk),
+        ('sort', 'clean_chunk', sort_by_crime_date_time),
+        ('date_filter', 'sort', lambda data: filter_date_range(data, from_date, to_date)),
+        ('crime_counts', 'date_filter', get_crime_counts),
+        ('crime_percents', 'crime_counts', get_crime_percents),
+        ('map_build', 'date_filter', build_map),
+    ]
+
+# Function to return the number of bytes of the output of a stage
+def output_bytes(output):
+    if isinstance(output, (pd.DataFrame, pd.Series)):
+        memory = output.memory_usage(deep=True)
+        return int(memory.sum()) if isinstance(memory, pd.Series) else int(memory)
+    if isinstance(output, str):
+        return len(output.encode('utf-8'))
+    return None
+
+# Function to run the stages on the raw data at path
+# Returns a list with the 'seconds', 'peak_bytes', 'output_bytes' and 'output_rows' of every stage
+def run_benchmark(path, repeat=3, stages=None):
+    outputs = {None: path}
+    results = []
+    for name, source, function in stages or pipeline_stages():
+        data = outputs[source]
+
+        # time the stage without tracemalloc, which slows down allocations
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = function(data)
+            seconds.append(time.perf_counter() - start)
+
+        # numpy and pandas report their buffers to tracemalloc, so the peak includes the arrays of the stage
+        tracemalloc.start()
+        try:
+            function(data)
+            _, peak_bytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        outputs[name] = output
+        results.append({
+            'stage': name,
+            'seconds': min(seconds),
+            'peak_bytes': peak_bytes,
+            'output_bytes': output_bytes(output),
+            'output_rows': len(output) if hasattr(output, '__len__') and not isinstance(output, str) else None,
+        })
+    return results
+
+# Function to return the versions and machine the benchmark ran with, to tell apart results from different setups
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+# Function to compare two benchmark results, returns the stages that got slower or use more memory
+# The ratios are new / old, e.g. 1.5 is 50% slower
+def compare_results(old, new, threshold=REGRESSION_THRESHOLD):
+    old_stages = {stage['stage']: stage for stage in old['stages']}
+    regressions = []
+    for stage in new['stages']:
+        before = old_stages.get(stage['stage'])
+        if before is None:
+            continue
+        time_ratio = stage['seconds'] / before['seconds'] if before['seconds'] else None
+        memory_ratio = stage['peak_bytes'] / before['peak_bytes'] if before['peak_bytes'] else None
+        slower = (time_ratio or 0) > 1 + threshold and stage['seconds'] - before['seconds'] > MIN_REGRESSION_SECONDS
+        if slower or (memory_ratio or 0) > 1 + threshold:
+            regressions.append({'stage': stage['stage'], 'time_ratio': time_ratio, 'memory_ratio': memory_ratio})
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the crime data pipeline")
+    parser.add_argument('path', help="raw data, e.g. made with python -m crime_data.synthetic_data")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--from-date', default=FROM_DATE)
+    parser.add_argument('--to-date', default=TO_DATE)
+    parser.add_argument('--output', help="JSON file to write the results to")
+    parser.add_argument('--compare', help="JSON file of an earlier run to compare the results with")
+    args = parser.parse_args()
+
+    stages = run_benchmark(args.path, args.repeat, pipeline_stages(args.from_date, args.to_date))
+    result = {
+        'path': args.path,
+        'rows': stages[0]['output_rows'],
+        'repeat': args.repeat,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'environment': environment(),
+        'stages': stages,
+    }
+
+    print(f"{'stage':<32} {'seconds':>9} {'peak MB':>9} {'output MB':>10} {'rows':>10}")
+    for stage in stages:
+        output_mb = '' if stage['output_bytes'] is None else f"{stage['output_bytes'] / 1e6:.1f}"
+        rows = '' if stage['output_rows'] is None else stage['output_rows']
+        print(f"{stage['stage']:<32} {stage['seconds']:>9.3f} {stage['peak_bytes'] / 1e6:>9.1f} {output_mb:>10} {rows:>10}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare_results(json.load(f), result)
+        for regression in regressions:
+            print(f"regression in {regression['stage']}: time x{regression['time_ratio'] or 0:.2f}, memory x{regression['memory_ratio'] or 0:.2f}")
+        # a non-zero exit code lets a script stop on a regression
+        sys.exit(1 if regressions else 0)
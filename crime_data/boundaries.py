@@ -0,0 +1,141 @@
+# Description: This file contains the functions to assign the crimes to the areas of a local GeoJSON file.
+# The areas (e.g. the police districts or neighborhoods of the city) are read from BOUNDARIES_PATH, and every crime is
+# given the code of the area polygon it falls in when it is cleaned. Only the crimes inside the bounding box of a polygon
+# are tested against it, sorted on latitude, so each edge of the polygon only looks at the crimes level with it.
+# Counting the crimes per area is then a bincount of the codes, and the map draws one shape per area.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Path of the GeoJSON file with the areas, set CRIME_DATA_BOUNDARIES to use another one
+# When the file does not exist the crimes are not assigned to areas
+BOUNDARIES_PATH = os.environ.get('CRIME_DATA_BOUNDARIES', "boundaries.geojson")
+
+# Properties of a feature its area name is read from, the first one present is used
+NAME_PROPERTIES = ['name', 'Name', 'NAME', 'dist_name', 'Dist_Name', 'DIST_NAME', 'label', 'Label', 'LABEL', 'Neighborhood', 'NBRDESC']
+
+# Loaded boundaries by path, with the size and mtime of the file they were loaded from
+loaded_boundaries = {}
+
+# Function to return the name of the area of a feature
+def feature_name(feature, number):
+    properties = feature.get('properties') or {}
+    for name in NAME_PROPERTIES:
+        if properties.get(name) not in (None, ''):
+            return str(properties[name]).strip()
+    return str(feature.get('id', number))
+
+# Function to return the polygons of a geometry as lists of rings, each ring an array of [longitude, latitude] rows
+def geometry_polygons(geometry):
+    if not geometry:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [[np.asarray(ring, dtype='float64')[:, :2] for ring in geometry['coordinates']]]
+    if geometry['type'] == 'MultiPolygon':
+        return [[np.asarray(ring, dtype='float64')[:, :2] for ring in polygon] for polygon in geometry['coordinates']]
+    return []
+
+# Function to load the areas of a GeoJSON file, they are only read again when the file changes
+# Returns a dict with the sorted area 'names', the 'polygons' as (name code, rings, bounding box) and the 'geojson',
+# or None when the file does not exist
+def load_boundaries(path=None):
+    path = path or BOUNDARIES_PATH
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    loaded = loaded_boundaries.get(path)
+    if loaded is not None and loaded['stat'] == (stat.st_size, stat.st_mtime_ns):
+        return loaded
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    geojson = json.loads(content)
+    features = geojson['features'] if geojson.get('type') == 'FeatureCollection' else [geojson]
+
+    names = [feature_name(feature, number) for number, feature in enumerate(features)]
+    categories = pd.Index(sorted(set(names)))
+    polygons = []
+    for name, feature in zip(names, features):
+        for rings in geometry_polygons(feature.get('geometry')):
+            exterior = rings[0]
+            bounding_box = (exterior[:, 0].min(), exterior[:, 1].min(), exterior[:, 0].max(), exterior[:, 1].max())
+            polygons.append((categories.get_loc(name), rings, bounding_box))
+
+    loaded = {'path': path, 'stat': (stat.st_size, stat.st_mtime_ns), 'fingerprint': hashlib.sha256(content).hexdigest(),
+              'names': categories, 'polygons': polygons, 'geojson': geojson, 'feature_names': names}
+    loaded_boundaries[path] = loaded
+    return loaded
+
+# Function to return the center of the areas as [latitude, longitude]
+def boundaries_center(boundaries):
+    boxes = np.array([bounding_box for _, _, bounding_box in boundaries['polygons']])
+    return [(boxes[:, 1].min() + boxes[:, 3].max()) / 2, (boxes[:, 0].min() + boxes[:, 2].max()) / 2]
+
+# Function to return the sha256 of the boundaries file, None when there is none
+def boundaries_fingerprint(path=None):
+    boundaries = load_boundaries(path)
+    return boundaries['fingerprint'] if boundaries is not None else None
+
+# Function to return which of the points are inside the rings of a polygon, holes included, with the even-odd rule
+# The points are sorted on latitude, so every edge only tests the points between its lowest and highest latitude
+def points_in_polygon(longitude, latitude, rings):
+    order = np.argsort(latitude, kind='stable')
+    x, y = longitude[order], latitude[order]
+    inside = np.zeros(len(x), dtype=bool)
+
+    for ring in rings:
+        x1, y1 = ring[:, 0], ring[:, 1]
+        x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+        # a point crosses an edge when its latitude is in [lowest, highest) of the edge, horizontal edges are never crossed
+        starts = np.searchsorted(y, np.minimum(y1, y2), side='left')
+        ends = np.searchsorted(y, np.maximum(y1, y2), side='left')
+        for edge in np.flatnonzero(ends > starts):
+            start, end = starts[edge], ends[edge]
+            crossing = x1[edge] + (y[start:end] - y1[edge]) * (x2[edge] - x1[edge]) / (y2[edge] - y1[edge])
+            inside[start:end] ^= x[start:end] < crossing
+
+    result = np.empty(len(x), dtype=bool)
+    result[order] = inside
+    return result
+
+# Function to return the code of the area each latitude/longitude is in, -1 for the points outside every area
+def area_codes(latitude, longitude, boundaries):
+    latitude = np.asarray(latitude, dtype='float64')
+    longitude = np.asarray(longitude, dtype='float64')
+    codes = np.full(len(latitude), -1, dtype='int32')
+    if boundaries is None or not len(latitude):
+        return codes
+
+    # the points sorted on longitude find the points inside the bounding box of a polygon with two binary searches
+    order = np.argsort(longitude, kind='stable')
+    sorted_longitude = longitude[order]
+    for code, rings, (west, south, east, north) in boundaries['polygons']:
+        start, end = np.searchsorted(sorted_longitude, [west, east], side='left')
+        candidates = order[start:end]
+        candidates = candidates[(latitude[candidates] >= south) & (latitude[candidates] <= north) & (codes[candidates] < 0)]
+        if len(candidates):
+            inside = points_in_polygon(longitude[candidates], latitude[candidates], rings)
+            codes[candidates[inside]] = code
+    return codes
+
+# Function to return the area of each crime as a categorical column, with every area of the boundaries as categories
+def area_column(data, boundaries):
+    names = boundaries['names'] if boundaries is not None else pd.Index([], dtype=object)
+    codes = area_codes(data['Latitude'], data['Longitude'], boundaries)
+    return pd.Series(pd.Categorical.from_codes(codes, categories=names), index=data.index, name='Area')
+
+# Function to count the crimes of the crime types per area, a bincount of the category codes
+# crimes is a list of Descriptions, None for all of them
+# Returns a Series indexed by the area names, areas without crimes are 0
+def count_by_area(data, crimes=None):
+    codes = data['Area'].cat.codes.to_numpy()
+    if crimes is not None:
+        crime_codes = data['Description'].cat.categories.get_indexer(list(crimes))
+        codes = codes[np.isin(data['Description'].cat.codes.to_numpy(), crime_codes[crime_codes >= 0])]
+    counts = np.bincount(codes[codes >= 0], minlength=len(data['Area'].cat.categories))
+    return pd.Series(counts, index=data['Area'].cat.categories.astype(str), name='count')
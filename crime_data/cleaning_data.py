@@ -0,0 +1,142 @@
+# Description: This file contains the functions to clean the data.
+
+import pandas as pd
+
+from crime_data.boundaries import area_column, boundaries_fingerprint, load_boundaries
+from crime_data.cleaning_rules import CLEANING_RULES, COMPILED_RULES, apply_rules, rows_to_keep, rules_version
+from crime_data.profiling import profiled
+
+# Path of the raw data exported by the city
+RAW_DATA_PATH = "Part_1_Crime_Data.csv"
+
+# Function to return the version of the cleaning, the cleaned data is rebuilt when it changes
+# It is a hash of the cleaning rules (see cleaning_rules.py), of the columns read with their types and of the
+# categorical columns, followed by the fingerprint of the boundaries the crimes are assigned to (see boundaries.py)
+def cleaning_rules_version():
+    version = rules_version({'rules': CLEANING_RULES, 'columns': FOCUSED_COLUMNS, 'categories': CATEGORY_COLUMNS})
+    fingerprint = boundaries_fingerprint()
+    return version if fingerprint is None else '%s-%s' % (version, fingerprint[:16])
+
+# Features : Expected Types
+#0 'X' : float,
+#1 'Y' : float,
+#2 'RowID' : int,
+#3 'CCNumber' : string,
+#4 'CrimeDateTime' : string,
+#5 'CrimeCode' : string,
+#6 'Description' : string,
+#7 'Inside/Outside' : I or O,
+#8 'Weapon' : string including 'NA',
+#9 'Post' : int,
+#10 'Gender' : M, F, or U,
+#11 'Age' : int,
+#12 'Race' : string,
+#13 'Ethnicity' : string,,
+#14 'Location' : string,
+#15 'Old_District' : string,
+#16 'New_District' : string,
+#17 'Neighborhood' : string,
+#18 'Latitude' : float,
+#19 'Longitude' : float,
+#20 'GeoLocation' : string,
+#21 'PremiseType' : string,
+#22 'Total_Incidents' : int
+
+# Columns of interest and the types they are read as, only these are loaded from the raw data
+FOCUSED_COLUMNS = {
+    'RowID': 'Int64',
+    'CCNumber': 'object',
+    'CrimeDateTime': 'object',
+    'Description': 'object',
+    'Weapon': 'object',
+    'Gender': 'object',
+    'Age': 'float64',
+    'Race': 'object',
+    'Latitude': 'float64',
+    'Longitude': 'float64',
+    'PremiseType': 'object',
+    'New_District': 'object',
+    'Neighborhood': 'object',
+}
+
+# Number of rows cleaned at a time in streaming mode
+DEFAULT_CHUNKSIZE = 250_000
+
+# Function to load the data, pass a chunksize to get an iterator of DataFrames instead
+def load_data(path=RAW_DATA_PATH, chunksize=None):
+    return pd.read_csv(path, usecols=list(FOCUSED_COLUMNS), dtype=FOCUSED_COLUMNS, chunksize=chunksize)
+
+# Function to focus on the columns of interest
+def focused_data(df):
+    focused_data = df[list(FOCUSED_COLUMNS)]
+    return focused_data
+
+# Columns stored as pandas categoricals in the cleaned data
+CATEGORY_COLUMNS = ['Description', 'Weapon', 'Gender', 'Race', 'PremiseType', 'New_District', 'Neighborhood', 'Area']
+
+# Function to drop the rows hit by a drop rule, e.g. the rows without a location
+def drop_invalid_rows(data, hits=None):
+    return data[rows_to_keep(data, COMPILED_RULES, hits)]
+
+# Function to clean one column with its rules, e.g. clean_column(data['Gender'])
+def clean_column(data, hits=None):
+    return COMPILED_RULES['columns'][data.name](data, hits)
+
+# Function to clean a DataFrame of focused columns, used for the whole data or a single chunk of it
+# The rules of cleaning_rules.py go through every column once, hits is a dict the rows each rule hit are added to
+def clean_chunk(data, hits=None):
+    cleaned_data = profiled('apply_rules', apply_rules, data, COMPILED_RULES, hits)
+
+    # the area of the boundaries file each crime is in, missing when there is no file
+    # (bump the 'engine' of the cleaning rules when this changes, it is not part of the hashed rules)
+    # found with the raw coordinates, the cleaned ones are rounded to float32
+    location = data.loc[cleaned_data.index, ['Latitude', 'Longitude']]
+    cleaned_data['Area'] = profiled('area_column', area_column, location, load_boundaries())
+    return cleaned_data
+
+# Function to sort the cleaned data on 'CrimeDateTime' so date ranges can be found with a binary search
+def sort_by_crime_date_time(data):
+    if not data['CrimeDateTime'].is_monotonic_increasing:
+        data = data.sort_values('CrimeDateTime', kind='stable')
+    return data
+
+# Function to give every categorical column sorted categories again, e.g. after chunks with different categories are combined
+def sort_categories(data):
+    for column in CATEGORY_COLUMNS:
+        # a column without a single value (e.g. 'Area' without a boundaries file) is read back from Parquet as nulls
+        if not isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].astype('category')
+        categories = data[column].cat.categories
+        if not categories.is_monotonic_increasing:
+            data[column] = data[column].cat.reorder_categories(categories.sort_values())
+    return data
+
+# Function to return a hash of every row of focused columns, used to find the rows that changed since they were cleaned
+def hash_rows(data):
+    return pd.util.hash_pandas_object(data[list(FOCUSED_COLUMNS)], index=False)
+
+# Function to combine cleaned chunks, in order, into one cleaned DataFrame sorted on 'CrimeDateTime'
+# The chunks are first given the same categories, otherwise pd.concat would turn the categorical columns into strings
+def combine_cleaned_chunks(chunks):
+    chunks = list(chunks)
+    for column in CATEGORY_COLUMNS:
+        categories = pd.Index(sorted(set().union(*(chunk[column].cat.categories for chunk in chunks))))
+        for chunk in chunks:
+            chunk[column] = chunk[column].cat.set_categories(categories)
+    return sort_by_crime_date_time(pd.concat(chunks))
+
+# Function to return a cleaned version of the data, hits is a dict the rows each cleaning rule hit are added to
+def clean_data(path=RAW_DATA_PATH, hits=None):
+    # Load the data
+    df = profiled('load_data', load_data, path)
+    data = profiled('focused_data', focused_data, df)
+
+    cleaned_data = profiled('clean_chunk', clean_chunk, data, hits)
+    return profiled('sort_by_crime_date_time', sort_by_crime_date_time, cleaned_data)
+
+# Function to clean the data in fixed-size chunks, yields each cleaned chunk as soon as it is ready
+# Peak memory is bounded by the chunksize instead of the size of the data
+# The chunks are each in file order, use sort_by_crime_date_time() once they are combined
+def iter_clean_data(path=RAW_DATA_PATH, chunksize=DEFAULT_CHUNKSIZE, hits=None):
+    for df in load_data(path, chunksize=chunksize):
+        yield profiled('clean_chunk', clean_chunk, focused_data(df), hits)
@@ -0,0 +1,201 @@
+# Description: This file contains the rules the raw data is cleaned with and the engine that applies them.
+# The rules are plain data: the rows that are dropped, and for every column the values that are mapped to other values,
+# the range its numbers must be in and the value its missing values are filled with. They are compiled once into a
+# cleaner per column that goes through the column a single time: the rules of a category column are applied to its
+# unique values and the rows are recoded with one take on the category codes, the rules of a number column are one mask.
+# Every rule counts the rows it changed or dropped, e.g. python -m crime_data.cleaning_rules Part_1_Crime_Data.csv
+# The version of the rules is a hash of them, so changing a rule rebuilds the cached cleaned data; changes to the code
+# that applies them are marked by bumping the 'engine' of the rules.
+
+import argparse
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+# Rules of the cleaning
+# 'drop' rules drop the rows with a missing value ('missing') or one of the 'values' in any of their 'columns'
+# Column rules by type:
+#   'category': 'normalize' the unique values ('upper' collapses the spaces and upper cases them, blank values become
+#               missing), 'map' them (new value -> list of old values) and 'fill' the missing values
+#   'number': values not 'above' and 'below' the bounds become missing, 'truncate' them to integers, stored as 'dtype'
+#   'datetime': parsed with 'format' in UTC, 'drop_missing' drops the rows that cannot be parsed
+# Columns without rules are kept as they are
+CLEANING_RULES = {
+    # bump it whenever the code applying the rules changes (e.g. the NORMALIZERS or the compilers below, or
+    # cleaning_data.clean_chunk()), so cached results are rebuilt; the rules themselves are hashed
+    'engine': 1,
+    'drop': [
+        {'name': 'invalid_location', 'columns': ['Longitude', 'Latitude'], 'missing': True, 'values': [0]},
+    ],
+    'columns': {
+        # e.g. '2014/01/01 00:00:00+00', other formats are guessed per value
+        'CrimeDateTime': {'type': 'datetime', 'format': '%Y/%m/%d %H:%M:%S%z', 'drop_missing': True},
+        'Description': {'type': 'category', 'map': {
+            'LARCENY': ['LARCENY FROM AUTO'],
+            'ROBBERY': ['ROBBERY - CARJACKING', 'ROBBERY - COMMERCIAL'],
+        }},
+        'Weapon': {'type': 'category', 'fill': 'No weapon'},
+        'Gender': {'type': 'category', 'fill': 'U', 'map': {
+            'M': ['Male', 'M\\'],
+            'F': ['Female', 'W'],
+            'U': ['B', 'Transgende', 'N', ',', 'FB', 'O', '160', 'FW', 'FU', 'D', '60', '120', '8', 'MB', 'A', '77', '17',
+                  'FF', '165', 'FM', '042819', 'S', 'T', '50'],
+        }},
+        'Age': {'type': 'number', 'above': 0, 'below': 115, 'truncate': True, 'dtype': 'Int8'},
+        'Race': {'type': 'category', 'fill': 'UNKNOWN'},
+        'Longitude': {'type': 'number', 'dtype': 'float32'},
+        'Latitude': {'type': 'number', 'dtype': 'float32'},
+        'PremiseType': {'type': 'category', 'fill': 'UNKNOWN'},
+        # the same area can be written with other capitals or spaces
+        'New_District': {'type': 'category', 'normalize': 'upper', 'fill': 'UNKNOWN'},
+        'Neighborhood': {'type': 'category', 'normalize': 'upper', 'fill': 'UNKNOWN'},
+    },
+}
+
+# Functions of the 'normalize' rule, they return None for values that become missing
+# Only their names are part of the hashed rules, bump the 'engine' of CLEANING_RULES when one of them changes
+NORMALIZERS = {
+    'upper': lambda value: ' '.join(str(value).split()).upper() or None,
+}
+
+# Function to return the version of the rules, a hash of them
+def rules_version(rules=CLEANING_RULES):
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+# Function to add the rows a rule hit to the hit counts, hits is a dict of rule name -> rows or None to not count
+def count_hits(hits, name, rows):
+    if hits is not None:
+        hits[name] = hits.get(name, 0) + int(rows)
+
+# Function to compile the rules of a category column
+def compile_category(column, rule):
+    normalize = NORMALIZERS[rule['normalize']] if 'normalize' in rule else None
+    mapping = {old: new for new, olds in rule.get('map', {}).items() for old in olds}
+    fill_value = rule.get('fill')
+
+    def clean(data, hits=None):
+        data = data.astype('category')
+        old_labels = list(data.cat.categories)
+
+        # apply the rules to the unique values, None is a value that became missing
+        normalized = [normalize(label) for label in old_labels] if normalize else old_labels
+        labels = [mapping.get(label, label) for label in normalized]
+        categories = {label for label in labels if label is not None}
+        if fill_value is not None:
+            categories.add(fill_value)
+        categories = pd.Index(sorted(categories))
+
+        # translate the old codes to the new codes, missing values (code -1, the last entry) become the fill value
+        missing_code = categories.get_loc(fill_value) if fill_value is not None else -1
+        translation = np.array([categories.get_loc(label) if label is not None else missing_code for label in labels] + [missing_code], dtype='int32')
+        codes = data.cat.codes.to_numpy()
+        new_codes = translation[codes]
+
+        if hits is not None:
+            # the rows of every unique value, the missing values last
+            rows = np.bincount(np.where(codes < 0, len(old_labels), codes), minlength=len(old_labels) + 1)
+            if normalize:
+                count_hits(hits, '%s.normalize' % column, sum(count for old, label, count in zip(old_labels, normalized, rows) if label != old))
+            for new in rule.get('map', {}):
+                count_hits(hits, '%s.map.%s' % (column, new), 0)
+            for label, count in zip(normalized, rows):
+                if label in mapping:
+                    count_hits(hits, '%s.map.%s' % (column, mapping[label]), count)
+            if fill_value is not None:
+                count_hits(hits, '%s.fill' % column, rows[-1] + sum(count for label, count in zip(labels, rows) if label is None))
+
+        return pd.Series(pd.Categorical.from_codes(new_codes, categories=categories), index=data.index, name=data.name)
+    return clean
+
+# Function to compile the rules of a number column
+def compile_number(column, rule):
+    def clean(data, hits=None):
+        values = pd.to_numeric(data, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        if 'above' in rule or 'below' in rule:
+            # comparisons with NaN are False, so the missing values stay missing
+            valid = (values > rule.get('above', -np.inf)) & (values < rule.get('below', np.inf))
+            count_hits(hits, '%s.range' % column, np.count_nonzero(~valid & ~np.isnan(values)))
+            values = np.where(valid, values, np.nan)
+        if rule.get('truncate'):
+            values = np.trunc(values)
+        return pd.Series(values, index=data.index, name=data.name).astype(rule.get('dtype', 'float64'))
+    return clean
+
+# Function to compile the rules of a datetime column, the rows that cannot be parsed are dropped by the caller
+def compile_datetime(column, rule):
+    def clean(data, hits=None):
+        try:
+            return pd.to_datetime(data, format=rule['format'], utc=True)
+        except (ValueError, TypeError):
+            # fall back to guessing the format of each value, values that cannot be parsed become NaT
+            return pd.to_datetime(data, format='mixed', utc=True, errors='coerce')
+    return clean
+
+# Compilers of the column rules by type
+COMPILERS = {'category': compile_category, 'number': compile_number, 'datetime': compile_datetime}
+
+# Function to compile the rules into the functions that apply them
+# Returns a dict with the 'drop' rules and a cleaner per column ('columns'), each called as cleaner(data, hits)
+def compile_rules(rules=CLEANING_RULES):
+    return {
+        'version': rules_version(rules),
+        'drop': rules['drop'],
+        'columns': {column: COMPILERS[rule['type']](column, rule) for column, rule in rules['columns'].items()},
+        'drop_missing': [column for column, rule in rules['columns'].items() if rule.get('drop_missing')],
+    }
+
+# Function to return which rows of a DataFrame no drop rule drops, one mask for all rules
+def rows_to_keep(data, compiled, hits=None):
+    keep = np.ones(len(data), dtype=bool)
+    for rule in compiled['drop']:
+        dropped = np.zeros(len(data), dtype=bool)
+        for column in rule['columns']:
+            values = data[column].to_numpy()
+            if rule.get('missing'):
+                dropped |= pd.isna(values)
+            if rule.get('values'):
+                dropped |= np.isin(values, rule['values'])
+        # a row is counted by the first rule that drops it
+        count_hits(hits, 'drop.%s' % rule['name'], np.count_nonzero(dropped & keep))
+        keep &= ~dropped
+    return keep
+
+# Function to apply the compiled rules to a DataFrame of raw columns
+# Returns the cleaned columns, in the order of the data, and adds the rows every rule hit to hits
+def apply_rules(data, compiled, hits=None):
+    data = data[rows_to_keep(data, compiled, hits)]
+    cleaned_data = pd.DataFrame({column: compiled['columns'][column](data[column], hits) if column in compiled['columns'] else data[column]
+                                 for column in data.columns})
+
+    # drop the rows whose value could not be parsed, e.g. a 'CrimeDateTime' that can never be selected by a date range
+    for column in compiled['drop_missing']:
+        missing = cleaned_data[column].isna().to_numpy()
+        count_hits(hits, '%s.drop_missing' % column, np.count_nonzero(missing))
+        if missing.any():
+            cleaned_data = cleaned_data[~missing]
+    return cleaned_data
+
+# Compiled rules of the cleaning
+COMPILED_RULES = compile_rules()
+
+# Count the rows every rule hits in the raw data, without writing the cleaned data
+if __name__ == '__main__':
+    # imported here because cleaning_data builds on this file
+    from crime_data.cleaning_data import DEFAULT_CHUNKSIZE, RAW_DATA_PATH, focused_data, load_data
+
+    parser = argparse.ArgumentParser(description="Count the rows every cleaning rule hits in the raw crime data")
+    parser.add_argument('path', nargs='?', default=RAW_DATA_PATH)
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    hits, rows = {}, 0
+    for df in load_data(args.path, chunksize=args.chunksize):
+        rows += len(df)
+        apply_rules(focused_data(df), COMPILED_RULES, hits)
+
+    print(f"rules version {COMPILED_RULES['version']}, {rows} rows")
+    print(f"{'rule':<40} {'rows':>10} {'percent':>8}")
+    for name, count in hits.items():
+        print(f"{name:<40} {count:>10} {100 * count / max(rows, 1):>8.2f}")
@@ -0,0 +1,46 @@
+# Description: This file contains the functions to build and query the aggregate count cube of the cleaned data.
+# The cube holds the number of crimes per day and combination of the dimensions below, so chart queries only
+# sum cube cells and their cost depends on the number of days in the date range instead of the number of crimes.
+
+import pandas as pd
+
+from crime_data.crime_stats import to_utc_timestamp
+
+# Version of the cube layout; bump it whenever the cube changes so persisted cubes are rebuilt
+CUBE_VERSION = 1
+
+# Columns of the cleaned data the crimes are counted by, next to the day
+CUBE_DIMENSIONS = ['Description', 'Weapon', 'PremiseType', 'Gender']
+
+# Function to build the cube from the cleaned data, the result is sorted on 'Day'
+def build_crime_cube(data):
+    day = data['CrimeDateTime'].dt.floor('D').rename('Day')
+    cube = data.groupby([day] + [data[column] for column in CUBE_DIMENSIONS], observed=True, sort=True).size()
+    cube = cube.rename('count').astype('int32').reset_index()
+    return cube
+
+# Function to return the cube cells from the from_date (included) to the to_date (excluded) that match the filters
+# filters is a dict of dimension -> list of allowed values, e.g. {'Weapon': ['FIREARM'], 'Gender': ['F']}
+def query_crime_cube(cube, from_date, to_date, filters=None):
+    start = cube['Day'].searchsorted(to_utc_timestamp(from_date), side='left')
+    end = cube['Day'].searchsorted(to_utc_timestamp(to_date), side='left')
+    cells = cube.iloc[start:end]
+
+    for column, values in (filters or {}).items():
+        cells = cells[cells[column].isin(values)]
+    return cells
+
+# Function to return the number of crimes per value of a dimension, e.g. per 'Description'
+def count_by(cells, dimension='Description'):
+    counts = cells.groupby(dimension, observed=True)['count'].sum()
+    counts.index = counts.index.astype(object)
+    return counts
+
+# Function to roll the day cells up to weeks ('W'), months ('MS'), years ('YS') or any other pandas frequency
+# Returns the same period x dimension table as crime_stats.get_crime_counts()
+def roll_up(cells, freq='MS', dimension='Description'):
+    grouped = cells.groupby([pd.Grouper(key='Day', freq=freq), dimension], observed=True)['count'].sum()
+    crime_counts = grouped.unstack(dimension, fill_value=0)
+    crime_counts.index = crime_counts.index.rename('CrimeDateTime')
+    crime_counts.columns = crime_counts.columns.astype(object)
+    return crime_counts
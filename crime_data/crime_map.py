@@ -0,0 +1,215 @@
+# Description: This file contains the functions to build the crime map.
+# All crimes are sent to the browser as one compact array of [latitude, longitude, description code] rows,
+# the markers, their clustering and the highlight of the selected crime are all created client side.
+
+import json
+import threading
+from collections import OrderedDict
+
+import folium
+import numpy as np
+from branca.element import MacroElement
+from folium import plugins
+from jinja2 import Template
+
+# Center of Baltimore, used when there are no crimes to center the map on
+DEFAULT_LOCATION = [39.2904, -76.6122]
+
+# Number of decimals the coordinates are rounded to, 5 decimals is about 1 meter
+COORDINATE_DECIMALS = 5
+
+# JavaScript function that turns one row of the data into a marker
+# descriptions and the code of the selected crime are filled in by marker_callback()
+MARKER_CALLBACK = """(function () {
+    var descriptions = %(descriptions)s;
+    var selected = %(selected)d;
+    var selectedIcon = L.AwesomeMarkers.icon({markerColor: 'red'});
+    var otherIcon = L.AwesomeMarkers.icon({markerColor: 'blue'});
+    return function (row) {
+        var marker = L.marker(new L.LatLng(row[0], row[1]));
+        marker.setIcon(row[2] === selected ? selectedIcon : otherIcon);
+        marker.bindPopup('Description: ' + (descriptions[row[2]] || ''));
+        //used when hovering over popup
+        marker.bindTooltip('Click for more info');
+        return marker;
+    };
+})()"""
+
+# Function to return the JavaScript callback that creates the markers for the given descriptions and selected crime
+def marker_callback(descriptions, crime):
+    selected = descriptions.index(crime) if crime in descriptions else -1
+    return MARKER_CALLBACK % {'descriptions': json.dumps(descriptions), 'selected': selected}
+
+# Function to return the [latitude, longitude, description code] rows of the data and the list of descriptions
+def marker_data(data):
+    descriptions = [str(description) for description in data['Description'].cat.categories]
+    latitudes = data['Latitude'].to_numpy(dtype='float64').round(COORDINATE_DECIMALS).tolist()
+    longitudes = data['Longitude'].to_numpy(dtype='float64').round(COORDINATE_DECIMALS).tolist()
+    codes = data['Description'].cat.codes.tolist()
+    marker_rows = [list(row) for row in zip(latitudes, longitudes, codes)]
+    return marker_rows, descriptions
+
+# FastMarkerCluster that keeps the rows as they are instead of validating every location in Python,
+# the rows come straight from the float columns of the cleaned data
+class CrimeMarkerCluster(plugins.FastMarkerCluster):
+    def __init__(self, data, callback):
+        super().__init__([], callback=callback)
+        self.data = data
+
+# Number of rendered maps kept in memory, the least recently used one is dropped first
+MAP_CACHE_SIZE = 32
+
+# Rendered maps by key, shared by all sessions of the app process
+rendered_maps = OrderedDict()
+rendered_maps_lock = threading.Lock()
+
+# Function to render a map to an HTML string in memory
+def render_map(crime_map):
+    return crime_map.get_root().render()
+
+# Function to return the rendered HTML of a map if it is in the cache, None otherwise
+def cached_map(key):
+    with rendered_maps_lock:
+        return rendered_maps.get(key)
+
+# Function to return the rendered HTML of a map from the cache, build_map() is only called when the key is not cached
+# The key should hold everything the map depends on, e.g. (data version, from_date, to_date, crime, map settings)
+def get_rendered_map(key, build_map):
+    with rendered_maps_lock:
+        if key in rendered_maps:
+            rendered_maps.move_to_end(key)
+            return rendered_maps[key]
+
+    html = render_map(build_map())
+
+    with rendered_maps_lock:
+        rendered_maps[key] = html
+        rendered_maps.move_to_end(key)
+        while len(rendered_maps) > MAP_CACHE_SIZE:
+            rendered_maps.popitem(last=False)
+    return html
+
+# Function to build the map with a clustered marker for every crime, the markers of the selected crime are red
+def build_crime_map(data, crime, location=None, zoom_start=12):
+    # create map
+    if location is None:
+        location = [data['Latitude'].mean(), data['Longitude'].mean()] if len(data) else DEFAULT_LOCATION
+    crime_map = folium.Map(location=location, zoom_start=zoom_start)
+
+    # Add all markers as one clustered layer
+    marker_rows, descriptions = marker_data(data)
+    CrimeMarkerCluster(marker_rows, marker_callback(descriptions, crime)).add_to(crime_map)
+
+    return crime_map
+
+# Largest radius in pixels of a grid cell circle, the cell with the most crimes gets it
+MAX_CELL_RADIUS = 16
+
+# Layer that draws one circle per grid cell from a compact array of
+# [latitude, longitude, radius, count of each description...] rows, the cells with the selected crime are red
+class GridCellLayer(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            (function () {
+                var descriptions = {{ this.descriptions|tojson }};
+                var selected = {{ this.selected }};
+                var cells = {{ this.cells|tojson }};
+                for (var i = 0; i < cells.length; i++) {
+                    var cell = cells[i];
+                    var lines = [];
+                    for (var j = 0; j < descriptions.length; j++) {
+                        if (cell[3 + j] > 0) {
+                            lines.push(descriptions[j] + ': ' + cell[3 + j]);
+                        }
+                    }
+                    var color = selected >= 0 && cell[3 + selected] > 0 ? 'red' : 'blue';
+                    L.circleMarker([cell[0], cell[1]], {radius: cell[2], color: color, weight: 1, fillOpacity: 0.5})
+                        .bindPopup(lines.join('<br>'))
+                        .addTo({{ this._parent.get_name() }});
+                }
+            })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, cells, descriptions, selected):
+        super().__init__()
+        self._name = 'GridCellLayer'
+        self.cells = cells
+        self.descriptions = descriptions
+        self.selected = selected
+
+# Function to build the map of the grid cells returned by spatial_grid.query_grid()
+def build_grid_map(cells, crime, location=None, zoom_start=12):
+    if location is None:
+        location = [cells['Latitude'].mean(), cells['Longitude'].mean()] if len(cells) else DEFAULT_LOCATION
+    crime_map = folium.Map(location=location, zoom_start=zoom_start)
+
+    descriptions = [column for column in cells.columns if column not in ('Total', 'Latitude', 'Longitude')]
+    selected = descriptions.index(crime) if crime in descriptions else -1
+
+    # the area of the circle grows with the number of crimes in the cell
+    total = cells['Total'].to_numpy(dtype='float64')
+    radius = np.sqrt(total / total.max()) * MAX_CELL_RADIUS if len(cells) else total
+    cell_rows = np.column_stack([
+        cells['Latitude'].to_numpy().round(COORDINATE_DECIMALS),
+        cells['Longitude'].to_numpy().round(COORDINATE_DECIMALS),
+        np.maximum(radius, 2).round(1),
+        cells[descriptions].to_numpy(dtype='float64'),
+    ])
+    GridCellLayer(cell_rows.tolist(), descriptions, selected).add_to(crime_map)
+
+    return crime_map
+
+# Colors of the heatmap from the fewest to the most crimes as [red, green, blue, alpha], cells without crimes stay transparent
+HEAT_COLORS = np.array([[255, 255, 178, 90], [254, 204, 92, 150], [253, 141, 60, 190], [240, 59, 32, 210], [189, 0, 38, 230]])
+
+# Function to color a raster of crime counts, the counts are on a log scale so a few hot spots do not hide the rest
+# Returns the image as an array of height x width x [red, green, blue, alpha] bytes
+def heat_image(raster):
+    scaled = np.log1p(raster)
+    if scaled.max() > 0:
+        scaled = scaled / scaled.max()
+    stops = np.linspace(0, 1, len(HEAT_COLORS))
+    image = np.stack([np.interp(scaled, stops, HEAT_COLORS[:, channel]) for channel in range(4)], axis=-1)
+    image[raster <= 0] = 0
+    return image.round().astype('uint8')
+
+# Function to build the map of a raster returned by heatmap.heat_raster(), drawn as one image over the map
+def build_heat_map(heat, location=None, zoom_start=12):
+    crime_map = folium.Map(location=location or DEFAULT_LOCATION, zoom_start=zoom_start)
+    if heat is None:
+        return crime_map
+
+    raster, (south, west, north, east) = heat
+    if location is None:
+        crime_map.location = [(south + north) / 2, (west + east) / 2]
+    # the rows of the raster are map tile rows, so the image lines up with the map without being reprojected
+    folium.raster_layers.ImageOverlay(heat_image(raster), bounds=[[south, west], [north, east]], mercator_project=False,
+                                      name='Crime density').add_to(crime_map)
+
+    return crime_map
+
+# Colors of the areas from the fewest to the most crimes
+CHOROPLETH_COLORS = ['#ffffb2', '#fecc5c', '#fd8d3c', '#f03b20', '#bd0026']
+
+# Function to build the map of the number of crimes per area of the boundaries (see boundaries.py), one shape per area
+# area_counts is a Series of the number of crimes indexed by the area names
+def build_choropleth_map(boundaries, area_counts, location=None, zoom_start=12):
+    from branca.colormap import LinearColormap
+    from crime_data.boundaries import boundaries_center
+
+    crime_map = folium.Map(location=location or boundaries_center(boundaries), zoom_start=zoom_start)
+    colormap = LinearColormap(CHOROPLETH_COLORS, vmin=0, vmax=max(int(area_counts.max()), 1) if len(area_counts) else 1,
+                              caption='Number of crimes')
+
+    # only the geometry and the count of each area are sent, not the other properties of the file
+    features = [{'type': 'Feature', 'geometry': feature.get('geometry'), 'properties': {'area': name, 'count': int(area_counts.get(name, 0))}}
+                for name, feature in zip(boundaries['feature_names'], boundaries['geojson'].get('features', [boundaries['geojson']]))]
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        style_function=lambda feature: {'fillColor': colormap(feature['properties']['count']), 'color': '#555555', 'weight': 1, 'fillOpacity': 0.6},
+        tooltip=folium.GeoJsonTooltip(fields=['area', 'count'], aliases=['Area', 'Crimes']),
+    ).add_to(crime_map)
+    colormap.add_to(crime_map)
+
+    return crime_map
@@ -0,0 +1,34 @@
+# Description: This file contains the functions to query and summarize the cleaned data.
+
+import pandas as pd
+
+# Function to convert a date from the sidebar to a UTC timestamp at midnight
+def to_utc_timestamp(date):
+    timestamp = pd.Timestamp(date)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize('UTC')
+    return timestamp.tz_convert('UTC')
+
+# Function to return the rows with 'CrimeDateTime' from the from_date (included) to the to_date (excluded)
+# The cleaned data is sorted on 'CrimeDateTime', so the range is found with two binary searches instead of a scan
+def filter_date_range(data, from_date, to_date):
+    crime_date_time = data['CrimeDateTime']
+    start = crime_date_time.searchsorted(to_utc_timestamp(from_date), side='left')
+    end = crime_date_time.searchsorted(to_utc_timestamp(to_date), side='left')
+    return data.iloc[start:end]
+
+# Function to count the crimes per month (or any other pandas frequency) and 'Description' in a single grouped pass
+# Returns a DataFrame with one row per month and one column per Description seen in the data
+def get_crime_counts(data, freq='MS'):
+    grouped = data.groupby([pd.Grouper(key='CrimeDateTime', freq=freq), 'Description'], observed=True).size()
+    crime_counts = grouped.unstack('Description', fill_value=0)
+    crime_counts.columns = crime_counts.columns.astype(object)
+    return crime_counts
+
+# Function to return the percent of each crime to all crimes per month from the counts of get_crime_counts()
+# Pass a list of categories to only keep those columns, categories without crimes get 0 percent
+def get_crime_percents(crime_counts, categories=None):
+    all_crimes = crime_counts.sum(axis=1)
+    if categories is not None:
+        crime_counts = crime_counts.reindex(columns=categories, fill_value=0)
+    return crime_counts.div(all_crimes, axis=0) * 100
@@ -0,0 +1,254 @@
+# Description: This file contains the functions to cache the cleaned data on disk.
+# The cleaned DataFrame is stored as a Parquet file next to a small JSON manifest that records
+# the fingerprint of the raw CSV and the version of the cleaning rules it was built with.
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from crime_data.cleaning_data import RAW_DATA_PATH, DEFAULT_CHUNKSIZE, cleaning_rules_version, clean_data, iter_clean_data, sort_by_crime_date_time, sort_categories
+from crime_data.crime_cube import CUBE_VERSION, build_crime_cube
+from crime_data.heatmap import HEAT_VERSION, build_heat_bins
+from crime_data.profiling import count_rows, profile_stage, profiled
+from crime_data.spatial_grid import GRID_VERSION, build_grid, split_grid_levels
+from crime_data.trends import TREND_VERSION, build_trend_counts
+
+# Directory where the cached cleaned data is stored, set CRIME_DATA_CACHE_DIR to use another one
+CACHE_DIR = os.environ.get('CRIME_DATA_CACHE_DIR', ".crime_cache")
+
+# Names of the files inside the cache directory
+CLEANED_FILE = "cleaned.parquet"
+MANIFEST_FILE = "manifest.json"
+
+# Function to hash a file without reading it into memory at once
+def hash_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Function to read the manifest of the cache, returns an empty dict if there is none
+def read_manifest(cache_dir=CACHE_DIR):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+# Function to return the path of the temporary file a file is written to before it is moved in place
+# It is unique per process, so processes writing the same file at once never write into each other's file
+def temporary_path(path):
+    return '%s.%d.tmp' % (path, os.getpid())
+
+# Function to write the manifest of the cache atomically
+def write_manifest(manifest, cache_dir=CACHE_DIR):
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    manifest_temporary_path = temporary_path(manifest_path)
+    with open(manifest_temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_temporary_path, manifest_path)
+
+# Function to return the fingerprint of the raw data file
+# The size and mtime are cheap to check; the hash is only recomputed when they do not match the manifest
+def source_fingerprint(path, manifest=None):
+    stat = os.stat(path)
+    fingerprint = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    source = (manifest or {}).get('source', {})
+    if source.get('size') == fingerprint['size'] and source.get('mtime_ns') == fingerprint['mtime_ns']:
+        fingerprint['sha256'] = source['sha256']
+    else:
+        fingerprint['sha256'] = hash_file(path)
+    return fingerprint
+
+# Function to check if the manifest matches the raw data file and the cleaning rules
+def is_cache_valid(manifest, fingerprint):
+    source = manifest.get('source', {})
+    return (manifest.get('rules_version') == cleaning_rules_version()
+            and source.get('size') == fingerprint['size']
+            and source.get('sha256') == fingerprint['sha256'])
+
+# Function to read the cleaned data back from a Parquet file
+def read_cleaned_parquet(path):
+    # chunks written separately can have different categories, pyarrow unifies them in order of appearance
+    data = sort_categories(pd.read_parquet(path))
+    # chunks are only sorted on their own, the combined data is sorted once here
+    return sort_by_crime_date_time(data)
+
+# Function to write a DataFrame to a Parquet file
+# It is written to a temporary file first so a reader never sees a half written file
+def write_parquet_file(data, path, index=True):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    data.to_parquet(temporary_path(path), index=index)
+    os.replace(temporary_path(path), path)
+
+# Function to write the cleaned data to the cache, rule_hits are the rows each cleaning rule hit while it was cleaned
+def write_cache(data, fingerprint, cache_dir=CACHE_DIR, rule_hits=None):
+    write_parquet_file(data, os.path.join(cache_dir, CLEANED_FILE))
+
+    write_manifest({'source': fingerprint, 'rules_version': cleaning_rules_version(), 'rows': len(data), 'rule_hits': rule_hits}, cache_dir)
+
+# Function to return the Arrow schema used for every chunk of the cleaned data
+def chunk_schema(chunk):
+    import pyarrow as pa
+
+    schema = pa.Schema.from_pandas(chunk, preserve_index=True)
+    # categorical columns of a chunk may have no categories at all, so their type is fixed to string dictionaries
+    for i, field in enumerate(schema):
+        if pa.types.is_dictionary(field.type):
+            schema = schema.set(i, field.with_type(pa.dictionary(pa.int32(), pa.string())))
+    return schema
+
+# Function to write an iterator of cleaned chunks to a Parquet file, one row group per chunk
+# Only one chunk is held in memory at a time, returns the number of rows written
+def write_parquet_chunks(chunks, output_path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            if writer is None:
+                # the first chunk decides the schema, later chunks are converted to it
+                writer = pq.ParquetWriter(output_path, chunk_schema(chunk))
+            writer.write_table(pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=True))
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return rows
+
+# Function to clean the raw data in chunks straight into the cache, rule_hits is a dict the rows each cleaning rule hit are added to
+def write_cache_chunked(path, fingerprint, cache_dir=CACHE_DIR, chunksize=None, rule_hits=None):
+    os.makedirs(cache_dir, exist_ok=True)
+    cleaned_path = os.path.join(cache_dir, CLEANED_FILE)
+
+    rows = write_parquet_chunks(iter_clean_data(path, chunksize or DEFAULT_CHUNKSIZE, rule_hits), temporary_path(cleaned_path))
+    os.replace(temporary_path(cleaned_path), cleaned_path)
+
+    write_manifest({'source': fingerprint, 'rules_version': cleaning_rules_version(), 'rows': rows, 'rule_hits': rule_hits}, cache_dir)
+
+# Function to return a string that changes whenever the cached cleaned data changes, to key in-memory caches on
+def cleaned_data_version(cache_dir=CACHE_DIR):
+    manifest = read_manifest(cache_dir)
+    return '%s-%s-%s' % (manifest.get('source', {}).get('sha256'), manifest.get('rules_version'), manifest.get('revision', 0))
+
+# Function to return the version of the cached cleaned data when load_cleaned_data() would serve it as it is, None otherwise
+# It never hashes the raw data: without the raw data the cache only has to be cleaned with the current rules, with the
+# raw data its size and mtime must also match those the cache was built from
+def current_data_version(path=RAW_DATA_PATH, cache_dir=CACHE_DIR):
+    manifest = read_manifest(cache_dir)
+    if manifest.get('rules_version') != cleaning_rules_version() or not os.path.exists(os.path.join(cache_dir, CLEANED_FILE)):
+        return None
+    if os.path.exists(path):
+        stat, source = os.stat(path), manifest.get('source', {})
+        if (source.get('size'), source.get('mtime_ns')) != (stat.st_size, stat.st_mtime_ns):
+            return None
+    return cleaned_data_version(cache_dir)
+
+# Function to return a key that changes whenever load_cleaned_data() could return different data, to key in-memory caches on
+# Unlike cleaned_data_version() it does not need the cache to be up to date, and it never hashes the raw data
+def cleaned_data_key(path=RAW_DATA_PATH, cache_dir=CACHE_DIR):
+    if not os.path.exists(path):
+        # a precomputed cache served without the raw data only changes when it is written again
+        return (None, None, cleaning_rules_version(), cleaned_data_version(cache_dir))
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime_ns, cleaning_rules_version(), read_manifest(cache_dir).get('revision', 0))
+
+# Function to return the cleaned data, loading it from the cache when the raw data and rules have not changed
+# With streaming=True the cache is rebuilt chunk by chunk so cleaning never holds the whole raw data in memory,
+# with workers=N it is rebuilt by cleaning partitions of the raw data in N processes
+# With incremental=True a changed raw file only has its new and changed rows cleaned and merged into the cache
+def load_cleaned_data(path=RAW_DATA_PATH, cache_dir=CACHE_DIR, streaming=False, chunksize=None, workers=None, incremental=False):
+    manifest = read_manifest(cache_dir)
+    cleaned_path = os.path.join(cache_dir, CLEANED_FILE)
+
+    # a cache precomputed elsewhere (e.g. by python -m crime_data.batch) can be served without the raw data
+    if not os.path.exists(path) and manifest.get('rules_version') == cleaning_rules_version() and os.path.exists(cleaned_path):
+        return profiled('read_cleaned_parquet', read_cleaned_parquet, cleaned_path)
+
+    fingerprint = source_fingerprint(path, manifest)
+
+    if is_cache_valid(manifest, fingerprint) and os.path.exists(cleaned_path):
+        # the mtime may have changed while the content did not, so refresh it in the manifest
+        if manifest['source'] != fingerprint:
+            manifest['source'] = fingerprint
+            write_manifest(manifest, cache_dir)
+        return profiled('read_cleaned_parquet', read_cleaned_parquet, cleaned_path)
+
+    if incremental:
+        # imported here because incremental_ingest builds on the functions of this file
+        from crime_data.incremental_ingest import can_apply_delta, apply_delta, write_row_hashes
+        if can_apply_delta(manifest, cache_dir):
+            return profiled('apply_delta', apply_delta, path, cache_dir, chunksize, fingerprint)
+
+    # the rows each cleaning rule hit are kept in the manifest
+    rule_hits = {}
+    with profile_stage('rebuild_cache') as record:
+        if streaming:
+            write_cache_chunked(path, fingerprint, cache_dir, chunksize, rule_hits)
+            cleaned_data = read_cleaned_parquet(cleaned_path)
+            # store the combined data sorted so warm loads do not sort it again
+            write_cache(cleaned_data, fingerprint, cache_dir, rule_hits)
+        elif workers:
+            # imported here because the process pool is only needed for a parallel rebuild
+            from crime_data.parallel_ingest import clean_data_parallel
+            cleaned_data = clean_data_parallel(path, workers, hits=rule_hits)
+            write_cache(cleaned_data, fingerprint, cache_dir, rule_hits)
+        else:
+            cleaned_data = clean_data(path, rule_hits)
+            write_cache(cleaned_data, fingerprint, cache_dir, rule_hits)
+        record['rows_out'] = count_rows(cleaned_data)
+
+    if incremental:
+        # remember a hash of every raw row so the next refresh can tell which rows changed
+        write_row_hashes(path, cache_dir, chunksize)
+    return cleaned_data
+
+# Function to return the path of a table derived from the cleaned data
+def derived_table_path(name, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, name + '.parquet')
+
+# Function to return a table derived from the cleaned data, loading it from the cache when it is up to date
+# The manifest is rewritten whenever the cleaned data is, which drops the entry of the derived table and makes it stale
+def load_derived_table(cleaned_data, name, version, build, cache_dir=CACHE_DIR):
+    manifest = read_manifest(cache_dir)
+    table_path = derived_table_path(name, cache_dir)
+
+    if manifest.get(name, {}).get('version') == version and os.path.exists(table_path):
+        return profiled('read_' + name, pd.read_parquet, table_path)
+
+    table = profiled('build_' + name, build, cleaned_data)
+    if manifest:
+        write_parquet_file(table, table_path, index=False)
+        manifest[name] = {'version': version, 'rows': len(table)}
+        write_manifest(manifest, cache_dir)
+    return table
+
+# Function to return the aggregate count cube of the cleaned data
+def load_crime_cube(cleaned_data, cache_dir=CACHE_DIR):
+    return load_derived_table(cleaned_data, 'cube', CUBE_VERSION, build_crime_cube, cache_dir)
+
+# Function to return the map grid of the cleaned data, split into one DataFrame per level
+def load_spatial_grid(cleaned_data, cache_dir=CACHE_DIR):
+    return split_grid_levels(load_derived_table(cleaned_data, 'grid', GRID_VERSION, build_grid, cache_dir))
+
+# Function to return the monthly heatmap bins of the cleaned data
+def load_heat_bins(cleaned_data, cache_dir=CACHE_DIR):
+    return load_derived_table(cleaned_data, 'heat', HEAT_VERSION, build_heat_bins, cache_dir)
+
+# Function to return the daily crime counts per area and Description the trends are computed from
+def load_trend_counts(cleaned_data, cache_dir=CACHE_DIR):
+    return load_derived_table(cleaned_data, 'trend', TREND_VERSION, build_trend_counts, cache_dir)
+
+# Tables derived from the cleaned data as (name, version, build function), kept up to date by incremental refreshes
+DERIVED_TABLES = [
+    ('cube', CUBE_VERSION, build_crime_cube),
+    ('grid', GRID_VERSION, build_grid),
+    ('heat', HEAT_VERSION, build_heat_bins),
+    ('trend', TREND_VERSION, build_trend_counts),
+]
@@ -0,0 +1,89 @@
+# Description: This file contains the functions to build the crime density heatmap.
+# The crimes are binned once into the cells of the map grid (see spatial_grid.py) per month and 'Description'.
+# A heatmap of a date range and crime type then only sums the bins of its months into one raster with a
+# vectorized bincount, no crime is looked at again, and the raster is drawn on the map as a single image.
+
+import numpy as np
+import pandas as pd
+
+from crime_data.crime_stats import to_utc_timestamp
+from crime_data.spatial_grid import cell_coordinates, cell_centers
+
+# Version of the heat bins; bump it whenever they change so persisted bins are rebuilt
+HEAT_VERSION = 1
+
+# Level of the map grid the crimes are binned at, a cell at level 17 is about 240 meters wide in Baltimore
+HEAT_LEVEL = 17
+
+# Largest width or height of a raster in cells, bigger rasters (e.g. because of far away outliers) are made coarser
+MAX_RASTER_SIZE = 512
+
+# Share of the bins left out at each side of a raster that is too big, so a few far away crimes do not stretch it
+OUTLIER_SHARE = 0.001
+
+# Function to return the first day of the month of each datetime, in UTC
+def month_start(crime_date_time):
+    months = crime_date_time.dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').astype('datetime64[M]')
+    return pd.DatetimeIndex(months.astype('datetime64[ns]')).tz_localize('UTC')
+
+# Function to bin the cleaned data per month, cell and 'Description'
+# Returns a DataFrame with the 'Month', 'CellX', 'CellY', 'Description' and 'count' columns, sorted on 'Month'
+def build_heat_bins(data):
+    cell_x, cell_y = cell_coordinates(data['Latitude'], data['Longitude'], HEAT_LEVEL)
+    keys = [pd.Series(month_start(data['CrimeDateTime']), index=data.index, name='Month'),
+            pd.Series(cell_x, index=data.index, name='CellX'),
+            pd.Series(cell_y, index=data.index, name='CellY'),
+            data['Description']]
+    return data.groupby(keys, observed=True, sort=True).size().rename('count').astype('int32').reset_index()
+
+# Function to return the bins of the months overlapping the from_date (included) to the to_date (excluded)
+# The bins are per month, so a range that starts or ends inside a month includes the whole month
+def bins_in_range(bins, from_date, to_date):
+    first_month = month_start(pd.Series([to_utc_timestamp(from_date)]))[0]
+    start = bins['Month'].searchsorted(first_month, side='left')
+    end = bins['Month'].searchsorted(to_utc_timestamp(to_date), side='left')
+    return bins.iloc[start:end]
+
+# Function to blur a raster with a 3 x 3 binomial kernel, a cheap kernel density estimate on the binned counts
+def smooth_raster(raster):
+    padded = np.pad(raster, 1)
+    rows = padded[:-2] + 2 * padded[1:-1] + padded[2:]
+    return (rows[:, :-2] + 2 * rows[:, 1:-1] + rows[:, 2:]) / 16
+
+# Function to sum the bins of a date range and crime types into a raster of crimes per cell
+# crimes is a list of Descriptions, None for all of them
+# Returns the raster (rows from north to south) and its bounds as (south, west, north, east), or None when there are no crimes
+def heat_raster(bins, from_date, to_date, crimes=None, smooth=True):
+    bins = bins_in_range(bins, from_date, to_date)
+    if crimes is not None:
+        bins = bins[bins['Description'].isin(crimes)]
+    if not len(bins):
+        return None
+
+    cell_x = bins['CellX'].to_numpy(dtype='int64')
+    cell_y = bins['CellY'].to_numpy(dtype='int64')
+    counts = bins['count'].to_numpy(dtype='float64')
+
+    # leave out the few bins far outside the city, when they make the raster too big
+    if max(np.ptp(cell_x), np.ptp(cell_y)) + 1 > MAX_RASTER_SIZE and len(bins) > 1 / OUTLIER_SHARE:
+        low_x, high_x = np.quantile(cell_x, [OUTLIER_SHARE, 1 - OUTLIER_SHARE]).astype('int64')
+        low_y, high_y = np.quantile(cell_y, [OUTLIER_SHARE, 1 - OUTLIER_SHARE]).astype('int64')
+        inside = (cell_x >= low_x) & (cell_x <= high_x) & (cell_y >= low_y) & (cell_y <= high_y)
+        cell_x, cell_y, counts = cell_x[inside], cell_y[inside], counts[inside]
+
+    # a cell at a coarser level is found by dropping bits, until the raster is small enough
+    level = HEAT_LEVEL
+    while max(np.ptp(cell_x), np.ptp(cell_y)) + 1 > MAX_RASTER_SIZE:
+        cell_x, cell_y, level = cell_x >> 1, cell_y >> 1, level - 1
+
+    min_x, min_y = cell_x.min(), cell_y.min()
+    width, height = int(cell_x.max() - min_x) + 1, int(cell_y.max() - min_y) + 1
+    raster = np.bincount((cell_y - min_y) * width + (cell_x - min_x), weights=counts, minlength=width * height)
+    raster = raster.reshape(height, width)
+    if smooth:
+        raster = smooth_raster(raster)
+
+    # the raster covers whole cells, from the north west corner of the first one to the south east corner of the last one
+    north, west = cell_centers(min_x - 0.5, min_y - 0.5, level)
+    south, east = cell_centers(min_x + width - 0.5, min_y + height - 0.5, level)
+    return raster, (float(south), float(west), float(north), float(east))
@@ -0,0 +1,71 @@
+# Description: This file contains the functions to page through the incidents of the cleaned data.
+# Only one page of rows is taken out of the data, after the filters and the sort are applied to positions
+# instead of copies of the rows, so what is sent to the browser is bounded by the page size and not by the date range.
+
+import numpy as np
+import pandas as pd
+
+# Columns of the cleaned data shown in the table, in order
+TABLE_COLUMNS = ['CrimeDateTime', 'Description', 'Weapon', 'Gender', 'Age', 'Race', 'PremiseType', 'New_District', 'Neighborhood',
+                 'Latitude', 'Longitude', 'CCNumber', 'RowID']
+
+# Columns that can be filtered on a list of values, the others are filtered on a range
+VALUE_FILTER_COLUMNS = ['Description', 'Weapon', 'Gender', 'Race', 'PremiseType', 'New_District', 'Neighborhood']
+RANGE_FILTER_COLUMNS = ['Age', 'Latitude', 'Longitude']
+
+# Page sizes the table can show, the largest bounds the rows sent per rerun
+PAGE_SIZES = [25, 50, 100, 250]
+
+# Function to return a mask of the rows matching the filters
+# filters is a dict of column -> list of allowed values, or column -> (low, high) for a range (both included)
+def filter_mask(data, filters):
+    mask = np.ones(len(data), dtype=bool)
+    for column, allowed in (filters or {}).items():
+        if column in VALUE_FILTER_COLUMNS:
+            if not allowed:
+                continue
+            # compare the category codes instead of the strings
+            codes = data[column].cat.categories.get_indexer(list(allowed))
+            mask &= np.isin(data[column].cat.codes.to_numpy(), codes[codes >= 0])
+        elif column in RANGE_FILTER_COLUMNS:
+            low, high = allowed
+            values = data[column].to_numpy(dtype='float64', na_value=np.nan)
+            mask &= (values >= low) & (values <= high)
+        else:
+            raise ValueError(f"cannot filter the table on {column!r}")
+    return mask
+
+# Function to return the values a column is sorted on, missing values sort last
+def sort_keys(data, column):
+    values = data[column]
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # the categories are sorted, so sorting the codes sorts the values; -1 is a missing value
+        codes = values.cat.codes.to_numpy().astype('int64')
+        return np.where(codes < 0, np.iinfo('int64').max, codes)
+    if column == 'CCNumber':
+        return values.fillna('\uffff').to_numpy(dtype=object)
+    return values.to_numpy(dtype='float64', na_value=np.inf)
+
+# Function to return one page of the rows of the data matching the filters, sorted on a column
+# page is 0 based; the ties of the sort keep the order of the data (by 'CrimeDateTime')
+# Returns the rows of the page and the number of rows matching the filters
+def get_incident_page(data, page=0, page_size=PAGE_SIZES[2], sort_by='CrimeDateTime', ascending=True, filters=None):
+    positions = np.flatnonzero(filter_mask(data, filters))
+    total = len(positions)
+
+    # the cleaned data is already sorted on 'CrimeDateTime', so sorting on it only needs the rows of the page
+    if sort_by != 'CrimeDateTime':
+        positions = positions[np.argsort(sort_keys(data, sort_by)[positions], kind='stable')]
+    # descending is the ascending order reversed, so the ties are in descending 'CrimeDateTime' order,
+    # the missing values are kept last
+    if not ascending:
+        missing = data[sort_by].isna().to_numpy()[positions]
+        positions = np.concatenate([positions[~missing][::-1], positions[missing][::-1]])
+
+    start = max(page, 0) * page_size
+    page_rows = data.iloc[positions[start:start + page_size]]
+    return page_rows[[column for column in TABLE_COLUMNS if column in page_rows.columns]], total
+
+# Function to return the number of pages of a number of rows
+def page_count(total, page_size):
+    return max((total + page_size - 1) // page_size, 1)
@@ -0,0 +1,155 @@
+# Description: This file contains the functions to merge new and changed crimes into the cached cleaned data.
+# A hash of every raw row is kept by 'RowID' next to the cleaned data. A refresh reads a raw file (a daily delta
+# or a new full export), only cleans the rows that are new or whose hash changed, replaces the old versions of
+# those rows in the cleaned data and updates the derived count tables by adding and subtracting their counts.
+# Rows missing from a new full export were retracted and are removed, rows missing from a daily delta file are kept
+# because it only holds the rows that changed.
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from crime_data.cleaning_data import DEFAULT_CHUNKSIZE, cleaning_rules_version, clean_chunk, combine_cleaned_chunks, focused_data, hash_rows, load_data
+from crime_data.data_cache import (CACHE_DIR, CLEANED_FILE, DERIVED_TABLES, derived_table_path, read_cleaned_parquet,
+                        read_manifest, write_manifest, write_parquet_file)
+
+# Name of the file with the hash of every raw row
+ROW_HASHES_FILE = "row_hashes.parquet"
+
+# Function to read the hash of every raw row, as a Series of hashes indexed by 'RowID'
+def read_row_hashes(cache_dir=CACHE_DIR):
+    row_hashes = pd.read_parquet(os.path.join(cache_dir, ROW_HASHES_FILE))
+    return row_hashes.set_index('RowID')['Hash']
+
+# Function to write the hash of every raw row, a later row wins when a 'RowID' is seen twice
+def write_row_hashes_file(row_hashes, cache_dir=CACHE_DIR):
+    row_hashes = row_hashes[~row_hashes.index.duplicated(keep='last')]
+    write_parquet_file(row_hashes.rename('Hash').rename_axis('RowID').reset_index(), os.path.join(cache_dir, ROW_HASHES_FILE), index=False)
+    return row_hashes
+
+# Function to hash every row of a raw file and store the hashes next to the cleaned data it was cleaned into
+def write_row_hashes(path, cache_dir=CACHE_DIR, chunksize=None):
+    hashes = []
+    for df in load_data(path, chunksize=chunksize or DEFAULT_CHUNKSIZE):
+        data = focused_data(df)
+        data = data[data['RowID'].notna()]
+        hashes.append(pd.Series(hash_rows(data).to_numpy(), index=data['RowID'].to_numpy(dtype='int64')))
+    row_hashes = write_row_hashes_file(pd.concat(hashes) if hashes else pd.Series(dtype='uint64'), cache_dir)
+
+    manifest = read_manifest(cache_dir)
+    manifest['watermark'] = int(row_hashes.index.max()) if len(row_hashes) else 0
+    write_manifest(manifest, cache_dir)
+
+# Function to check if the cache can be refreshed incrementally instead of being rebuilt
+def can_apply_delta(manifest, cache_dir=CACHE_DIR):
+    return (manifest.get('rules_version') == cleaning_rules_version()
+            and 'watermark' in manifest
+            and os.path.exists(os.path.join(cache_dir, CLEANED_FILE))
+            and os.path.exists(os.path.join(cache_dir, ROW_HASHES_FILE)))
+
+# Function to return the rows of a raw chunk that are new or changed, and their hashes indexed by 'RowID'
+# Rows above the watermark are new without looking them up, the others are compared with their stored hash
+# Rows without a 'RowID' cannot be tracked and are left out
+def changed_rows(data, row_hashes, watermark):
+    data = data[data['RowID'].notna()]
+    hashes = hash_rows(data).to_numpy()
+    row_ids = data['RowID'].to_numpy(dtype='int64')
+
+    changed = row_ids > watermark
+    known = np.flatnonzero(~changed)
+    if len(row_hashes):
+        positions = row_hashes.index.get_indexer(row_ids[known])
+        stored = row_hashes.to_numpy()[np.maximum(positions, 0)]
+        changed[known] = (positions < 0) | (stored != hashes[known])
+    else:
+        changed[known] = True
+
+    return data[changed], pd.Series(hashes[changed], index=row_ids[changed])
+
+# Function to add the counts of the added rows to a derived count table and subtract those of the removed rows
+def merge_counts(table, added, removed):
+    keys = [column for column in table.columns if column != 'count']
+    removed = removed.assign(count=-removed['count'])
+    merged = pd.concat([table, added, removed], ignore_index=True)
+    merged = merged.groupby(keys, observed=True, sort=True)['count'].sum().reset_index()
+    return merged[merged['count'] > 0].astype({'count': 'int32'}).reset_index(drop=True)
+
+# Function to merge the new and changed rows of a raw file into the cached cleaned data and derived tables
+# fingerprint is given when the raw file is a new full export of the main data: it is recorded as the source of the
+# cache, and the rows of the cache missing from it were retracted and are removed. A delta file (fingerprint None)
+# only holds the rows that changed, so rows missing from it are kept
+def apply_delta(path, cache_dir=CACHE_DIR, chunksize=None, fingerprint=None):
+    manifest = read_manifest(cache_dir)
+    cleaned_data = read_cleaned_parquet(os.path.join(cache_dir, CLEANED_FILE))
+    row_hashes = read_row_hashes(cache_dir)
+    watermark = manifest['watermark']
+
+    # find and clean only the new and changed rows, one chunk of the raw file at a time
+    cleaned_chunks, new_hashes, rule_hits, seen_row_ids = [], [], {}, []
+    for df in load_data(path, chunksize=chunksize or DEFAULT_CHUNKSIZE):
+        data = focused_data(df)
+        if fingerprint is not None:
+            seen_row_ids.append(data['RowID'].dropna().to_numpy(dtype='int64'))
+        rows, hashes = changed_rows(data, row_hashes, watermark)
+        if len(rows):
+            cleaned_chunks.append(clean_chunk(rows, rule_hits))
+            new_hashes.append(hashes)
+
+    # the rows of a full export missing from it were retracted
+    retracted = pd.Index([], dtype='int64')
+    if fingerprint is not None:
+        retracted = row_hashes.index.difference(pd.Index(np.concatenate(seen_row_ids) if seen_row_ids else [], dtype='int64'))
+
+    changed_count = sum(len(hashes) for hashes in new_hashes)
+    if changed_count or len(retracted):
+        new_hashes = pd.concat(new_hashes) if new_hashes else pd.Series(dtype='uint64')
+        touched = cleaned_data['RowID'].isin(new_hashes.index.union(retracted))
+        removed = cleaned_data[touched]
+
+        # the new rows are numbered after the rows already in the cleaned data
+        added = combine_cleaned_chunks(cleaned_chunks) if cleaned_chunks else cleaned_data.iloc[:0]
+        first_row = int(cleaned_data.index.max()) + 1 if len(cleaned_data) else 0
+        added.index = pd.RangeIndex(first_row, first_row + len(added))
+
+        cleaned_data = combine_cleaned_chunks([cleaned_data[~touched].copy(), added])
+        write_parquet_file(cleaned_data, os.path.join(cache_dir, CLEANED_FILE))
+
+        # update the derived tables that are up to date instead of building them again
+        for name, version, build in DERIVED_TABLES:
+            table_path = derived_table_path(name, cache_dir)
+            if manifest.get(name, {}).get('version') == version and os.path.exists(table_path):
+                table = merge_counts(pd.read_parquet(table_path), build(added), build(removed))
+                write_parquet_file(table, table_path, index=False)
+                manifest[name] = {'version': version, 'rows': len(table)}
+
+        row_hashes = write_row_hashes_file(pd.concat([row_hashes.drop(retracted), new_hashes]), cache_dir)
+        if len(new_hashes):
+            manifest['watermark'] = max(watermark, int(new_hashes.index.max()))
+        manifest['revision'] = manifest.get('revision', 0) + 1
+
+    # a new full export of the main data becomes the source of the cache, a delta file leaves the source as it is
+    if fingerprint is not None:
+        manifest['source'] = fingerprint
+    manifest['rows'] = len(cleaned_data)
+    manifest['last_delta'] = {'path': os.path.abspath(path), 'changed_rows': changed_count, 'retracted_rows': len(retracted),
+                              'rule_hits': rule_hits}
+    write_manifest(manifest, cache_dir)
+    return cleaned_data
+
+# Apply a daily delta file of new and changed crimes to the cache, e.g. python -m crime_data.incremental_ingest delta.csv
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Merge the new and changed crimes of a raw file into the cached cleaned data")
+    parser.add_argument('path')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    args = parser.parse_args()
+
+    if not can_apply_delta(read_manifest(args.cache_dir), args.cache_dir):
+        parser.error("the cache was not built with incremental=True, load the data with load_cleaned_data(incremental=True) first")
+
+    start = time.perf_counter()
+    cleaned_data = apply_delta(args.path, args.cache_dir)
+    changed = read_manifest(args.cache_dir)['last_delta']['changed_rows']
+    print(f"merged {changed} new or changed rows into {len(cleaned_data)} rows in {time.perf_counter() - start:.2f} seconds")
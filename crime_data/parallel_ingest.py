@@ -0,0 +1,89 @@
+# Description: This file contains the functions to clean the raw data in parallel on all cores.
+# The raw CSV is split into byte ranges that start and end on row boundaries, each range is read and cleaned
+# in its own process, and the cleaned ranges are combined in file order into the same result as clean_data().
+# Rows are split on newlines, so the raw data must not have newlines inside quoted values.
+
+import argparse
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from crime_data.cleaning_data import RAW_DATA_PATH, FOCUSED_COLUMNS, clean_chunk, clean_data, combine_cleaned_chunks
+from crime_data.cleaning_rules import count_hits
+
+# Function to return the byte offsets of the partitions of the raw data, each one starting at the beginning of a row
+# Returns the header line and a list of (start, end) byte ranges covering all rows after the header
+def partition_offsets(path, partitions):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        data_start = f.tell()
+
+        offsets = [data_start]
+        for partition in range(1, partitions):
+            position = data_start + (size - data_start) * partition // partitions
+            # move to the start of the next row; starting one byte early keeps a row that starts exactly at position
+            f.seek(max(position - 1, data_start))
+            f.readline()
+            offsets.append(max(f.tell(), offsets[-1]))
+        offsets.append(size)
+
+    ranges = [(start, end) for start, end in zip(offsets[:-1], offsets[1:]) if end > start]
+    return header, ranges
+
+# Function to read and clean one byte range of the raw data, runs in a worker process
+# Returns the cleaned rows, indexed by their row number inside the range, the number of raw rows in the range
+# and the rows each cleaning rule hit
+def clean_partition(path, header, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        rows = f.read(end - start)
+
+    df = pd.read_csv(io.BytesIO(header + rows), usecols=list(FOCUSED_COLUMNS), dtype=FOCUSED_COLUMNS)
+    hits = {}
+    return clean_chunk(df[list(FOCUSED_COLUMNS)], hits), len(df), hits
+
+# Function to return a cleaned version of the data, cleaning partitions of the raw data in a process pool
+# The result is identical to clean_data(): same rows, values, types, index and order
+# hits is a dict the rows each cleaning rule hit are added to
+def clean_data_parallel(path=RAW_DATA_PATH, workers=None, partitions=None, hits=None):
+    workers = workers or os.cpu_count() or 1
+    header, ranges = partition_offsets(path, partitions or workers)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(clean_partition, path, header, start, end) for start, end in ranges]
+        results = [future.result() for future in futures]
+
+    # number the rows of every partition after the rows of the partitions before it, like a single read_csv does
+    chunks = []
+    first_row = 0
+    for cleaned, raw_rows, partition_hits in results:
+        for name, rows in partition_hits.items():
+            count_hits(hits, name, rows)
+        cleaned.index = cleaned.index + first_row
+        chunks.append(cleaned)
+        first_row += raw_rows
+
+    return combine_cleaned_chunks(chunks)
+
+# Scaling benchmark: clean the raw data serially and with each number of workers, and check the results are identical
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the parallel cleaning of the raw crime data")
+    parser.add_argument('path', nargs='?', default=RAW_DATA_PATH)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    serial = clean_data(args.path)
+    serial_time = time.perf_counter() - start
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8} {'identical':>10}")
+    print(f"{'serial':>8} {serial_time:>9.2f} {1:>8.2f} {'':>10}")
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        parallel = clean_data_parallel(args.path, workers)
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>8} {elapsed:>9.2f} {serial_time / elapsed:>8.2f} {str(parallel.equals(serial)):>10}")
@@ -0,0 +1,95 @@
+# Description: This file contains the background workers of the app.
+# Maps are rendered on worker threads, so the script shows the rest of the page while a map is built, and a rerun
+# caused by new input does not wait for a map of the old input. While the user reads the page, the maps of the likely
+# next filter states (e.g. the other crime types, the date windows next to the current one) are rendered ahead into the
+# map cache by a single low priority worker. The work of a filter state is queued in a batch, and the batch is cancelled
+# when the user moves on: its queued work is dropped unless another session waits for it, and its running work
+# is left to finish into the cache.
+
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError
+
+# Number of threads rendering the maps the users are waiting for, and rendering maps ahead
+RENDER_WORKERS = 2
+WARM_WORKERS = 1
+
+# Seconds between the checks of a map the script is waiting for
+WAIT_POLL_SECONDS = 0.1
+
+# Thread pools shared by all sessions of the app process
+render_executor = ThreadPoolExecutor(RENDER_WORKERS, thread_name_prefix='crime-data-render')
+warm_executor = ThreadPoolExecutor(WARM_WORKERS, thread_name_prefix='crime-data-warm')
+
+# Queued and running work by key as (future, executor, batches waiting for it), so the same map is never built twice
+# at the same time; the lock is reentrant because cancelling a future under it runs forget_task() right away
+tasks = {}
+tasks_lock = threading.RLock()
+
+# Function to return a new batch of background work
+def new_batch():
+    return {'cancelled': threading.Event(), 'futures': []}
+
+# Function to return whether every batch waiting for a piece of work was cancelled
+def all_cancelled(batches):
+    return all(batch['cancelled'].is_set() for batch in batches)
+
+# Function to cancel a batch, its work that has not started yet is dropped unless another batch is waiting for it
+def cancel_batch(batch):
+    batch['cancelled'].set()
+    with tasks_lock:
+        for future, batches in batch['futures']:
+            if all_cancelled(batches):
+                future.cancel()
+
+# Function to run the work of the batches, unless they were all cancelled while it was queued
+def run_task(function, batches):
+    with tasks_lock:
+        if all_cancelled(batches):
+            return None
+    return function()
+
+# Function to forget a finished task
+def forget_task(key, future):
+    with tasks_lock:
+        if key in tasks and tasks[key][0] is future:
+            del tasks[key]
+
+# Function to run function() on a worker thread as part of a batch, returns its future
+# Work with the same key that is queued or running is shared instead, work queued on the low priority worker is moved
+# to the executor when it has not started yet
+# The future resolves to None when every batch waiting for it was cancelled before it started
+def submit_task(key, function, batch, executor=render_executor):
+    with tasks_lock:
+        future, task_executor, batches = tasks.get(key, (None, None, []))
+        if future is not None and task_executor is not executor and executor is render_executor and future.cancel():
+            # cancelled before it started, so it never runs
+            future = None
+        if future is None or future.done():
+            batches = [batch]
+            future = executor.submit(run_task, function, batches)
+            tasks[key] = (future, executor, batches)
+            future.add_done_callback(lambda done, key=key: forget_task(key, done))
+        elif batch not in batches:
+            batches.append(batch)
+        batch['futures'].append((future, batches))
+    return future
+
+# Function to run function() ahead on the low priority worker, unless work with the same key is queued or running
+def warm_task(key, function, batch):
+    with tasks_lock:
+        if key in tasks:
+            return
+    submit_task(key, function, batch, warm_executor)
+
+# Function to wait for the result of a future, on_wait() is called between the checks
+# In the app on_wait() updates the page, which is where Streamlit stops a script whose input changed
+# Returns None when the work was cancelled, the caller then does it itself
+def wait_for(future, on_wait=None, poll=WAIT_POLL_SECONDS):
+    while True:
+        try:
+            return future.result(timeout=poll)
+        except TimeoutError:
+            if on_wait is not None:
+                on_wait()
+        except CancelledError:
+            return None
@@ -0,0 +1,128 @@
+# Description: This file contains the functions to profile the stages of the data pipeline and of the app.
+# A run (e.g. one rerun of the app) collects a record per stage with its wall time, the number of rows going in
+# and out and the memory of the process. Every record is also logged as one JSON line to the 'crime_data.profile'
+# logger. Only the clock and the process memory counters are read, so it is cheap enough to leave on, and when no
+# run was started in the current thread a stage costs a single attribute lookup.
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory is then not recorded
+    resource = None
+
+# Logger the stage records are written to as JSON lines
+logger = logging.getLogger('crime_data.profile')
+
+# Environment variable with the path of a file to write the log to, it is written to stderr otherwise
+PROFILE_LOG_ENV = 'CRIME_DATA_PROFILE_LOG'
+
+# Run of the current thread, every session of the app reruns its script in its own thread
+current = threading.local()
+
+# Function to send the log to a file or stderr, one JSON record per line
+def configure_profile_log(path=None):
+    if logger.handlers:
+        return
+    path = path or os.environ.get(PROFILE_LOG_ENV)
+    handler = logging.FileHandler(path, encoding='utf-8') if path else logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Function to return the current and the peak resident memory of the process in bytes, None when they are not known
+def memory_usage():
+    rss = peak = None
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+    return rss, peak
+
+# Function to start profiling the stages run by the current thread
+def start_run(name):
+    current.run = {'run': name, 'started': time.time(), 'stages': []}
+    current.depth = 0
+
+# Function to stop profiling the current thread, returns the run with its stage records
+def finish_run():
+    run = getattr(current, 'run', None)
+    current.run = None
+    if run is not None:
+        run['seconds'] = time.time() - run['started']
+        logger.info(json.dumps({'run': run['run'], 'stage': None, 'seconds': run['seconds'], 'stages': len(run['stages'])}))
+    return run
+
+# Function to return the number of rows of a DataFrame, Series or array, None for anything else
+def count_rows(data):
+    shape = getattr(data, 'shape', None)
+    return int(shape[0]) if shape else None
+
+# Context manager that records a stage of the current run, set record['rows_out'] inside the block
+# Stages can be nested, the record keeps the depth so the panel can indent them
+@contextmanager
+def profile_stage(name, rows_in=None):
+    run = getattr(current, 'run', None)
+    if run is None:
+        yield {}
+        return
+
+    record = {'stage': name, 'depth': current.depth, 'rows_in': rows_in, 'rows_out': None}
+    rss_before, peak_before = memory_usage()
+    current.depth += 1
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - start
+        current.depth -= 1
+        rss_after, peak_after = memory_usage()
+        record['rss_bytes'] = rss_after
+        record['rss_change_bytes'] = rss_after - rss_before if rss_after is not None else None
+        # the stage raised the peak memory of the process by this much, 0 when it stayed below an earlier peak
+        record['peak_growth_bytes'] = peak_after - peak_before if peak_after is not None else None
+        # records are added when the stage ends, the start time keeps them in the order the stages started
+        record['start'] = start
+        run['stages'].append(record)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({'run': run['run'], **record}))
+
+# Function to call function(*args, **kwargs) as a stage, the rows in are those of the first argument
+def profiled(name, function, *args, **kwargs):
+    with profile_stage(name, count_rows(args[0]) if args else None) as record:
+        result = function(*args, **kwargs)
+        record['rows_out'] = count_rows(result)
+    return result
+
+# Function to return the stages of a run in the order they started, stages run more than once (e.g. per chunk) are summed
+# Returns a list of dicts with the 'stage', 'depth', 'calls', 'seconds', 'rows_in', 'rows_out' and memory in MB
+def summarize_run(run):
+    stages = {}
+    for record in sorted(run['stages'], key=lambda record: record['start']):
+        key = (record['stage'], record['depth'])
+        if key not in stages:
+            stages[key] = {'stage': record['stage'], 'depth': record['depth'], 'calls': 0, 'seconds': 0.0,
+                           'rows_in': None, 'rows_out': None, 'rss_mb': None, 'peak_growth_mb': None}
+        stage = stages[key]
+        stage['calls'] += 1
+        stage['seconds'] += record['seconds']
+        for column in ('rows_in', 'rows_out'):
+            if record[column] is not None:
+                stage[column] = (stage[column] or 0) + record[column]
+        if record['rss_bytes'] is not None:
+            stage['rss_mb'] = max(stage['rss_mb'] or 0, record['rss_bytes'] / 1e6)
+        if record['peak_growth_bytes'] is not None:
+            stage['peak_growth_mb'] = (stage['peak_growth_mb'] or 0) + record['peak_growth_bytes'] / 1e6
+    return list(stages.values())
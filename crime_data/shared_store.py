@@ -0,0 +1,96 @@
+# Description: This file contains the functions to share the cleaned data between processes through a memory-mapped file.
+# The cleaned data is published as an uncompressed Arrow IPC file per version, and a small CURRENT file points to the
+# version to use. Every process maps the file instead of reading it, so the numbers, dates and category codes of the
+# crimes are the pages of the file in the page cache, held once by the operating system however many processes (and
+# sessions) use them. A new version is written next to the old one and swapped in by replacing CURRENT, processes that
+# still use the old version keep their mapping until they open the new one.
+
+import json
+import os
+
+import pandas as pd
+
+from crime_data.data_cache import CACHE_DIR
+
+# Directory of the published versions inside the cache directory, and the name of the file pointing to the current one
+SHARED_DIR = "shared"
+CURRENT_FILE = "CURRENT"
+
+# Number of published versions kept, older ones are deleted when a new one is published
+KEEP_VERSIONS = 2
+
+# Function to return the directory of the published versions
+def shared_path(cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, SHARED_DIR)
+
+# Function to read the CURRENT file, returns an empty dict if nothing was published
+def read_current(cache_dir=CACHE_DIR):
+    try:
+        with open(os.path.join(shared_path(cache_dir), CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+# Function to write the CURRENT file atomically, which swaps in the version it points to
+def write_current(current, cache_dir=CACHE_DIR):
+    current_path = os.path.join(shared_path(cache_dir), CURRENT_FILE)
+    temporary_path = '%s.%d.tmp' % (current_path, os.getpid())
+    with open(temporary_path, 'w', encoding='utf-8') as f:
+        json.dump(current, f, indent=2)
+    os.replace(temporary_path, current_path)
+
+# Function to delete the published versions other than the newest ones
+# On Linux and macOS a process that still maps a deleted version keeps using it, on Windows the file stays until it is closed
+def delete_old_versions(cache_dir=CACHE_DIR, keep=KEEP_VERSIONS):
+    directory = shared_path(cache_dir)
+    files = sorted((entry for entry in os.scandir(directory) if entry.name.endswith('.arrow')),
+                   key=lambda entry: entry.stat().st_mtime_ns, reverse=True)
+    for entry in files[keep:]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+# Function to publish the cleaned data as the current version, version is data_cache.cleaned_data_version()
+def publish_shared_data(cleaned_data, version, cache_dir=CACHE_DIR):
+    import pyarrow as pa
+
+    directory = shared_path(cache_dir)
+    os.makedirs(directory, exist_ok=True)
+    file_name = 'cleaned-%s.arrow' % version
+    file_path = os.path.join(directory, file_name)
+
+    # a version is only written once, a process publishing the same version again only points CURRENT to it
+    if not os.path.exists(file_path):
+        table = pa.Table.from_pandas(cleaned_data)
+        temporary_path = '%s.%d.tmp' % (file_path, os.getpid())
+        # written uncompressed, so the columns can be used straight from the mapped file
+        with pa.OSFile(temporary_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temporary_path, file_path)
+
+    write_current({'file': file_name, 'version': version}, cache_dir)
+    delete_old_versions(cache_dir)
+
+# Function to map the current version of the cleaned data
+# When version is given (e.g. data_cache.current_data_version()), None is returned unless it is the current version,
+# the batch run and the app processes compute it the same way, with or without the raw data
+# Returns the cleaned data and its version, or None when nothing usable was published
+def open_shared_data(cache_dir=CACHE_DIR, version=None):
+    import pyarrow as pa
+
+    current = read_current(cache_dir)
+    if not current or (version is not None and current.get('version') != version):
+        return None
+    try:
+        with pa.memory_map(os.path.join(shared_path(cache_dir), current['file']), 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+    except (FileNotFoundError, pa.ArrowInvalid):
+        # deleted or replaced by another process in the meantime
+        return None
+
+    # the columns of numbers, dates and strings (e.g. 'CCNumber', kept as Arrow strings) stay in the mapped file,
+    # only the category codes are built in memory by pandas, they are 1 or 2 bytes per crime
+    cleaned_data = table.to_pandas(split_blocks=True, self_destruct=True, types_mapper={pa.string(): pd.ArrowDtype(pa.string())}.get)
+    return cleaned_data, current['version']
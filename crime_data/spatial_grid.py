@@ -0,0 +1,108 @@
+# Description: This file contains the functions to pre-aggregate the crimes on a hierarchical map grid.
+# The grid follows the web map tiles: a cell at level L is a map tile at zoom L, and the 4 cells of level L + 1
+# inside it are its children. For each level the crimes are counted per day, cell and 'Description', so the map
+# only has to sum the cells of the date range inside the viewport instead of sending every crime to the browser.
+
+import numpy as np
+import pandas as pd
+
+from crime_data.crime_stats import to_utc_timestamp
+
+# Version of the grid layout; bump it whenever the grid changes so persisted grids are rebuilt
+GRID_VERSION = 1
+
+# Levels of the grid that are pre-aggregated, from coarse to fine
+GRID_LEVELS = [11, 13, 15, 17]
+
+# A map at zoom Z is drawn with the cells of level Z + CELL_LEVEL_OFFSET, which are 256 / 2**3 = 32 pixels wide
+CELL_LEVEL_OFFSET = 3
+
+# From this zoom on the map shows the crimes themselves instead of grid cells
+STREET_LEVEL_ZOOM = 15
+
+# Largest latitude of the web map projection
+MAX_LATITUDE = 85.05112878
+
+# Function to return the x and y cell of each latitude/longitude at a level of the grid
+def cell_coordinates(latitude, longitude, level):
+    scale = 2.0 ** level
+    latitude = np.radians(np.clip(np.asarray(latitude, dtype='float64'), -MAX_LATITUDE, MAX_LATITUDE))
+    longitude = np.asarray(longitude, dtype='float64')
+
+    cell_x = np.floor((longitude + 180.0) / 360.0 * scale)
+    cell_y = np.floor((1.0 - np.log(np.tan(latitude) + 1.0 / np.cos(latitude)) / np.pi) / 2.0 * scale)
+    return cell_x.astype('int32'), cell_y.astype('int32')
+
+# Function to return the latitude and longitude of the center of cells at a level of the grid
+def cell_centers(cell_x, cell_y, level):
+    scale = 2.0 ** level
+    longitude = (np.asarray(cell_x) + 0.5) / scale * 360.0 - 180.0
+    latitude = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * (np.asarray(cell_y) + 0.5) / scale))))
+    return latitude, longitude
+
+# Function to return the grid level used to draw a map at a zoom
+def grid_level_for_zoom(zoom):
+    levels = [level for level in GRID_LEVELS if level <= zoom + CELL_LEVEL_OFFSET]
+    return max(levels) if levels else GRID_LEVELS[0]
+
+# Function to build the grid from the cleaned data
+# Returns a DataFrame with the 'Level', 'Day', 'CellX', 'CellY', 'Description' and 'count' columns, sorted on 'Level' and 'Day'
+def build_grid(data):
+    finest_level = GRID_LEVELS[-1]
+    cell_x, cell_y = cell_coordinates(data['Latitude'], data['Longitude'], finest_level)
+    day = data['CrimeDateTime'].dt.floor('D').rename('Day')
+
+    levels = []
+    for level in GRID_LEVELS:
+        # a cell at a coarser level is found by dropping the bits of the finer levels
+        shift = finest_level - level
+        keys = [day,
+                pd.Series(cell_x >> shift, index=data.index, name='CellX'),
+                pd.Series(cell_y >> shift, index=data.index, name='CellY'),
+                data['Description']]
+        counts = data.groupby(keys, observed=True, sort=True).size().rename('count').astype('int32').reset_index()
+        counts.insert(0, 'Level', np.int8(level))
+        levels.append(counts)
+    return pd.concat(levels, ignore_index=True)
+
+# Function to split the grid into one DataFrame per level
+def split_grid_levels(grid):
+    return {int(level): cells.drop(columns='Level').reset_index(drop=True) for level, cells in grid.groupby('Level')}
+
+# Function to return the cell ranges of a viewport at a level as (min_x, max_x, min_y, max_y)
+# bounds is (south, west, north, east) in degrees
+def viewport_cells(bounds, level):
+    south, west, north, east = bounds
+    min_x, min_y = cell_coordinates([north], [west], level)
+    max_x, max_y = cell_coordinates([south], [east], level)
+    return min_x[0], max_x[0], min_y[0], max_y[0]
+
+# Function to count the crimes per cell and 'Description' inside the viewport at a zoom, between the from_date and to_date
+# grid_levels is the result of split_grid_levels(); bounds is (south, west, north, east) or None for everything
+# Returns a DataFrame with one row per cell, a column per Description, the 'Latitude'/'Longitude' of the cell center and the 'Total'
+def query_grid(grid_levels, zoom, from_date, to_date, bounds=None):
+    level = grid_level_for_zoom(zoom)
+    cells = grid_levels[level]
+
+    start = cells['Day'].searchsorted(to_utc_timestamp(from_date), side='left')
+    end = cells['Day'].searchsorted(to_utc_timestamp(to_date), side='left')
+    cells = cells.iloc[start:end]
+
+    if bounds is not None:
+        min_x, max_x, min_y, max_y = viewport_cells(bounds, level)
+        cells = cells[cells['CellX'].between(min_x, max_x) & cells['CellY'].between(min_y, max_y)]
+
+    counts = cells.groupby(['CellX', 'CellY', 'Description'], observed=True)['count'].sum().unstack('Description', fill_value=0)
+    counts.columns = counts.columns.astype(object)
+
+    latitude, longitude = cell_centers(counts.index.get_level_values('CellX'), counts.index.get_level_values('CellY'), level)
+    counts['Total'] = counts.sum(axis=1)
+    counts['Latitude'] = latitude
+    counts['Longitude'] = longitude
+    return counts
+
+# Function to return the rows of the cleaned data inside the bounds (south, west, north, east)
+def filter_bounds(data, bounds):
+    south, west, north, east = bounds
+    inside = data['Latitude'].between(south, north) & data['Longitude'].between(west, east)
+    return data[inside]
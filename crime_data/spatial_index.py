@@ -0,0 +1,136 @@
+# Description: This file contains the functions to build and query a spatial index over the cleaned data.
+# The crimes are bucketed into a uniform grid of square cells (in meters) and stored cell by cell, so a query
+# only looks at the few contiguous runs of crimes in the cells it overlaps instead of scanning the whole data.
+
+import numpy as np
+
+from crime_data.crime_stats import to_utc_timestamp
+
+# Mean radius of the earth in meters
+EARTH_RADIUS = 6_371_008.8
+
+# Width of a grid cell in meters
+DEFAULT_CELL_SIZE = 250.0
+
+# Relative margin added around a query box to cover the error of the projection
+PROJECTION_MARGIN = 0.01
+
+# Function to project latitudes/longitudes to x/y meters from an origin, accurate enough at the scale of a city
+# x_scale is the cosine of the latitude the east-west distances are measured at
+def project(latitude, longitude, origin, x_scale):
+    origin_latitude, origin_longitude = origin
+    x = np.radians(np.asarray(longitude, dtype='float64') - origin_longitude) * EARTH_RADIUS * x_scale
+    y = np.radians(np.asarray(latitude, dtype='float64') - origin_latitude) * EARTH_RADIUS
+    return x, y
+
+# Function to return the great-circle distance in meters between a point and arrays of latitudes/longitudes
+def haversine_distance(latitude, longitude, latitudes, longitudes):
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    a = (np.sin((latitudes - latitude) / 2) ** 2
+         + np.cos(latitude) * np.cos(latitudes) * np.sin((longitudes - longitude) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+# Function to build the spatial index of the cleaned data
+# Returns a dict with the grid layout and the columns needed by the queries, all in cell order
+def build_spatial_index(data, cell_size=DEFAULT_CELL_SIZE):
+    latitude = data['Latitude'].to_numpy(dtype='float64')
+    longitude = data['Longitude'].to_numpy(dtype='float64')
+    origin = (float(latitude.min()), float(longitude.min())) if len(data) else (0.0, 0.0)
+    # east-west distances are measured on the latitude furthest from the equator, so they never overstate real ones
+    x_scale = float(np.cos(np.radians(np.abs(latitude).max()))) if len(data) else 1.0
+
+    x, y = project(latitude, longitude, origin, x_scale)
+    cell_x = (x // cell_size).astype('int64')
+    cell_y = (y // cell_size).astype('int64')
+    columns = int(cell_x.max()) + 1 if len(data) else 1
+    rows = int(cell_y.max()) + 1 if len(data) else 1
+
+    # cells are numbered column by column, so the cells of one column in a query are one contiguous run
+    # only the sorted cell numbers are kept, so far away outliers do not make the grid any bigger
+    cell = cell_x * rows + cell_y
+    order = np.argsort(cell, kind='stable')
+
+    return {
+        'cell_size': cell_size,
+        'origin': origin,
+        'x_scale': x_scale,
+        'columns': columns,
+        'rows': rows,
+        'cells': cell[order],
+        'positions': order,
+        'latitude': latitude[order],
+        'longitude': longitude[order],
+        'times': data['CrimeDateTime'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view('int64')[order],
+        'codes': data['Description'].cat.codes.to_numpy()[order],
+        'descriptions': data['Description'].cat.categories,
+    }
+
+# Function to return the index slots of the crimes in the cells overlapping the box (min_x, min_y, max_x, max_y) in meters
+def candidate_slots(index, min_x, min_y, max_x, max_y):
+    cell_size, rows = index['cell_size'], index['rows']
+    first_x, last_x = max(int(min_x // cell_size), 0), min(int(max_x // cell_size), index['columns'] - 1)
+    first_y, last_y = max(int(min_y // cell_size), 0), min(int(max_y // cell_size), rows - 1)
+    if first_x > last_x or first_y > last_y:
+        return np.empty(0, dtype='int64')
+
+    # one contiguous run of slots per column of cells, found with two binary searches
+    columns = np.arange(first_x, last_x + 1)
+    starts = np.searchsorted(index['cells'], columns * rows + first_y, side='left')
+    ends = np.searchsorted(index['cells'], columns * rows + last_y, side='right')
+    return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+# Function to only keep the slots of the crimes matching the Description and date filters
+def filter_slots(index, slots, descriptions=None, from_date=None, to_date=None):
+    keep = np.ones(len(slots), dtype=bool)
+    if descriptions is not None:
+        codes = index['descriptions'].get_indexer(list(descriptions))
+        keep &= np.isin(index['codes'][slots], codes[codes >= 0])
+    if from_date is not None:
+        keep &= index['times'][slots] >= to_utc_timestamp(from_date).value
+    if to_date is not None:
+        keep &= index['times'][slots] < to_utc_timestamp(to_date).value
+    return slots[keep]
+
+# Function to return the positions (for data.iloc) of the crimes within radius meters of a point, in data order
+def radius_query(index, latitude, longitude, radius, descriptions=None, from_date=None, to_date=None):
+    x, y = project(latitude, longitude, index['origin'], index['x_scale'])
+    margin = radius * (1 + PROJECTION_MARGIN)
+    slots = candidate_slots(index, x - margin, y - margin, x + margin, y + margin)
+    slots = filter_slots(index, slots, descriptions, from_date, to_date)
+
+    distance = haversine_distance(latitude, longitude, index['latitude'][slots], index['longitude'][slots])
+    return np.sort(index['positions'][slots[distance <= radius]])
+
+# Function to return the positions (for data.iloc) of the crimes inside the bounds (south, west, north, east), in data order
+def bbox_query(index, bounds, descriptions=None, from_date=None, to_date=None):
+    south, west, north, east = bounds
+    # x only depends on the longitude and y on the latitude, so the bounds are a box in meters too
+    min_x, min_y = project(south, west, index['origin'], index['x_scale'])
+    max_x, max_y = project(north, east, index['origin'], index['x_scale'])
+    slots = candidate_slots(index, min_x, min_y, max_x, max_y)
+    slots = filter_slots(index, slots, descriptions, from_date, to_date)
+
+    latitude, longitude = index['latitude'][slots], index['longitude'][slots]
+    inside = (latitude >= south) & (latitude <= north) & (longitude >= west) & (longitude <= east)
+    return np.sort(index['positions'][slots[inside]])
+
+# Function to return the positions (for data.iloc) of the k nearest crimes to a point, nearest first
+# The search radius doubles until it holds k crimes, every crime closer than the k-th one is then inside it
+def nearest_query(index, latitude, longitude, k, descriptions=None, from_date=None, to_date=None):
+    x, y = project(latitude, longitude, index['origin'], index['x_scale'])
+    max_radius = index['cell_size'] * (index['columns'] + index['rows']) + abs(x) + abs(y)
+    radius = index['cell_size']
+    while True:
+        margin = radius * (1 + PROJECTION_MARGIN)
+        slots = candidate_slots(index, x - margin, y - margin, x + margin, y + margin)
+        slots = filter_slots(index, slots, descriptions, from_date, to_date)
+        distance = haversine_distance(latitude, longitude, index['latitude'][slots], index['longitude'][slots])
+        within = distance <= radius
+        if within.sum() >= k or radius >= max_radius:
+            break
+        radius *= 2
+
+    slots, distance = slots[within], distance[within]
+    nearest = np.argsort(distance, kind='stable')[:k]
+    return index['positions'][slots[nearest]]
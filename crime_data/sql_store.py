@@ -0,0 +1,186 @@
+# Description: This file contains the functions of the SQL store of the cleaned data.
+# The cleaned data is copied into a SQLite file in the cache directory, with indexes on the time and the crime type,
+# so the crimes can be queried with SQL without loading the cleaned data into memory. The filters of the app (date
+# range, crime type and map bounds) become WHERE clauses, and results are fetched in batches of rows, e.g.
+# python -m crime_data.sql_store "SELECT Description, COUNT(*) AS crimes FROM incidents GROUP BY Description"
+# 'CrimeDateTime' is stored as seconds since 1970 in UTC, use datetime(CrimeDateTime, 'unixepoch') to show it as a date.
+
+import argparse
+import os
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+
+from crime_data.crime_stats import to_utc_timestamp
+from crime_data.data_cache import CACHE_DIR, CLEANED_FILE, cleaned_data_version, temporary_path
+
+# Name of the SQLite file inside the cache directory
+SQL_FILE = "incidents.sqlite"
+
+# Number of rows inserted or fetched at a time
+SQL_BATCH_ROWS = 50_000
+
+# Indexes of the 'incidents' table, the date range filter uses the first, the crime type filter the second
+SQL_INDEXES = {
+    'incidents_time': ['CrimeDateTime'],
+    'incidents_description_time': ['Description', 'CrimeDateTime'],
+    'incidents_location': ['Latitude', 'Longitude'],
+}
+
+# Function to return the path of the SQLite file
+def sql_store_path(cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, SQL_FILE)
+
+# Function to return the type of each column of the 'incidents' table from the types of the cleaned data
+# Datetimes are stored as seconds since 1970 in UTC, categories and strings as text
+def sql_column_types(data):
+    column_types = {}
+    for column, dtype in data.dtypes.items():
+        if pd.api.types.is_datetime64_any_dtype(dtype) or pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+            column_types[column] = 'INTEGER'
+        elif pd.api.types.is_float_dtype(dtype):
+            column_types[column] = 'REAL'
+        else:
+            column_types[column] = 'TEXT'
+    return column_types
+
+# Function to turn a batch of the cleaned data into rows for the 'incidents' table
+def sql_rows(batch):
+    columns = {}
+    for column in batch.columns:
+        values = batch[column]
+        if pd.api.types.is_datetime64_any_dtype(values.dtype):
+            seconds = values.to_numpy(dtype='datetime64[s]', na_value=np.datetime64('NaT')).astype('int64')
+            columns[column] = np.where(values.isna().to_numpy(), None, seconds).tolist()
+        else:
+            # missing values of every type become NULL
+            columns[column] = values.astype(object).where(values.notna(), None).tolist()
+    return zip(*columns.values())
+
+# Function to return the version of the cleaned data a SQLite file was built from, None when there is no file
+def sql_store_version(cache_dir=CACHE_DIR):
+    path = sql_store_path(cache_dir)
+    if not os.path.exists(path):
+        return None
+    connection = sqlite3.connect(path)
+    try:
+        row = connection.execute("SELECT value FROM metadata WHERE key = 'data_version'").fetchone()
+    except sqlite3.DatabaseError:
+        row = None
+    finally:
+        connection.close()
+    return row[0] if row else None
+
+# Function to copy the cleaned data of the cache into the SQLite file, one batch of rows at a time
+# It is written to a temporary file first so a reader never sees a half written file
+def build_sql_store(cache_dir=CACHE_DIR, batch_rows=SQL_BATCH_ROWS):
+    import pyarrow.parquet as pq
+
+    path = sql_store_path(cache_dir)
+    build_path = temporary_path(path)
+    if os.path.exists(build_path):
+        os.remove(build_path)
+
+    connection = sqlite3.connect(build_path)
+    try:
+        # the file is rebuilt from the cache if anything goes wrong, so it does not need a journal while it is written
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        # the columns and their types are those of the cleaned data the app serves
+        parquet_file = pq.ParquetFile(os.path.join(cache_dir, CLEANED_FILE))
+        column_types = sql_column_types(parquet_file.schema_arrow.empty_table().to_pandas())
+        connection.execute("CREATE TABLE incidents (%s)" % ', '.join('%s %s' % item for item in column_types.items()))
+        insert = "INSERT INTO incidents VALUES (%s)" % ', '.join('?' * len(column_types))
+
+        for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=list(column_types)):
+            connection.executemany(insert, sql_rows(batch.to_pandas()[list(column_types)]))
+
+        # the indexes are created after the rows are inserted, which is faster than keeping them up to date
+        for name, columns in SQL_INDEXES.items():
+            connection.execute("CREATE INDEX %s ON incidents (%s)" % (name, ', '.join(columns)))
+        connection.execute("CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute("INSERT INTO metadata VALUES ('data_version', ?)", (cleaned_data_version(cache_dir),))
+        connection.commit()
+        connection.execute("ANALYZE")
+    finally:
+        connection.close()
+    os.replace(build_path, path)
+
+# Function to open the SQLite file read only, it is built first when it is missing or was built from other cleaned data
+def connect_sql_store(cache_dir=CACHE_DIR):
+    if sql_store_version(cache_dir) != cleaned_data_version(cache_dir):
+        build_sql_store(cache_dir)
+    return sqlite3.connect('file:%s?mode=ro' % sql_store_path(cache_dir), uri=True)
+
+# Function to return the WHERE clause and its parameters for the filters of the app
+# crimes is a list of Descriptions and bounds is (south, west, north, east), None for no filter
+def incident_filters(from_date=None, to_date=None, crimes=None, bounds=None):
+    clauses, parameters = [], []
+    if from_date is not None:
+        clauses.append("CrimeDateTime >= ?")
+        parameters.append(int(to_utc_timestamp(from_date).timestamp()))
+    if to_date is not None:
+        clauses.append("CrimeDateTime < ?")
+        parameters.append(int(to_utc_timestamp(to_date).timestamp()))
+    if crimes is not None:
+        clauses.append("Description IN (%s)" % ', '.join('?' * len(crimes)))
+        parameters.extend(str(crime) for crime in crimes)
+    if bounds is not None:
+        south, west, north, east = bounds
+        clauses.append("Latitude BETWEEN ? AND ? AND Longitude BETWEEN ? AND ?")
+        parameters.extend([float(south), float(north), float(west), float(east)])
+    return ' AND '.join(clauses) or '1', parameters
+
+# Function to run a query and return its rows as DataFrames of at most batch_rows rows
+def run_query(connection, sql, parameters=(), batch_rows=SQL_BATCH_ROWS):
+    cursor = connection.execute(sql, parameters)
+    try:
+        columns = [column[0] for column in cursor.description or []]
+        while True:
+            rows = cursor.fetchmany(batch_rows)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns)
+    finally:
+        cursor.close()
+
+# Function to return the crimes matching the filters of the app as DataFrames of at most batch_rows rows, sorted on time
+# columns is a list of columns, None for all of them, 'CrimeDateTime' is turned back into a UTC datetime
+def query_incidents(connection, from_date=None, to_date=None, crimes=None, bounds=None, columns=None, batch_rows=SQL_BATCH_ROWS):
+    columns = list(columns or ['*'])
+    where, parameters = incident_filters(from_date, to_date, crimes, bounds)
+    sql = "SELECT %s FROM incidents WHERE %s ORDER BY CrimeDateTime" % (', '.join(columns), where)
+    for batch in run_query(connection, sql, parameters, batch_rows):
+        if 'CrimeDateTime' in batch.columns:
+            batch['CrimeDateTime'] = pd.to_datetime(batch['CrimeDateTime'], unit='s', utc=True)
+        yield batch
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run a SQL query on the 'incidents' table of the cleaned crime data")
+    parser.add_argument('sql', nargs='?', help="query to run, the crimes matching the filters are listed when it is left out")
+    parser.add_argument('--cache-dir', default=CACHE_DIR, help="cache directory of the cleaned data, e.g. written by python -m crime_data.batch")
+    parser.add_argument('--from-date')
+    parser.add_argument('--to-date')
+    parser.add_argument('--crime', action='append', help="crime type, can be repeated")
+    parser.add_argument('--bounds', type=float, nargs=4, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'))
+    parser.add_argument('--batch-rows', type=int, default=SQL_BATCH_ROWS)
+    args = parser.parse_args()
+
+    if not os.path.exists(os.path.join(args.cache_dir, CLEANED_FILE)):
+        parser.error(f"there is no cleaned data in {args.cache_dir}, run python -m crime_data.batch first")
+
+    connection = connect_sql_store(args.cache_dir)
+    if args.sql:
+        batches = run_query(connection, args.sql, batch_rows=args.batch_rows)
+    else:
+        batches = query_incidents(connection, args.from_date, args.to_date, args.crime, args.bounds, batch_rows=args.batch_rows)
+    try:
+        # the rows are written as CSV one batch at a time, so a large result is never held in memory at once
+        for number, batch in enumerate(batches):
+            batch.to_csv(sys.stdout, index=False, header=number == 0)
+    finally:
+        # the cursor is closed before the connection
+        batches.close()
+        connection.close()
@@ -0,0 +1,192 @@
+# Description: This file contains the functions to generate synthetic raw crime data.
+# The rows follow the 23-column schema of the raw data documented in cleaning_data.py and include the dirty
+# values the cleaners deal with (odd gender codes, out of range ages, zero or missing coordinates, missing
+# weapons, descriptions that are combined), so performance problems can be reproduced without the real export.
+# The output only depends on the number of rows and the seed, e.g. python -m crime_data.synthetic_data 1m raw_1m.csv
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from crime_data.cleaning_rules import CLEANING_RULES
+
+# Columns of the raw data, in order
+RAW_COLUMNS = ['X', 'Y', 'RowID', 'CCNumber', 'CrimeDateTime', 'CrimeCode', 'Description', 'Inside/Outside', 'Weapon',
+               'Post', 'Gender', 'Age', 'Race', 'Ethnicity', 'Location', 'Old_District', 'New_District', 'Neighborhood',
+               'Latitude', 'Longitude', 'GeoLocation', 'PremiseType', 'Total_Incidents']
+
+# Number of rows of the standard data sets
+SIZES = {'100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+
+# Crime codes and descriptions with how often they occur
+DESCRIPTIONS = {
+    '6D': ('LARCENY FROM AUTO', 0.14),
+    '6E': ('LARCENY', 0.22),
+    '4E': ('COMMON ASSAULT', 0.18),
+    '5A': ('BURGLARY', 0.12),
+    '4C': ('AGG. ASSAULT', 0.10),
+    '7A': ('AUTO THEFT', 0.09),
+    '3AF': ('ROBBERY', 0.06),
+    '3K': ('ROBBERY - CARJACKING', 0.01),
+    '3B': ('ROBBERY - COMMERCIAL', 0.02),
+    '9S': ('SHOOTING', 0.03),
+    '1F': ('HOMICIDE', 0.01),
+    '2A': ('RAPE', 0.01),
+    '8AO': ('ARSON', 0.01),
+}
+
+# Values of the 'Weapon', 'Race', 'Ethnicity', 'PremiseType' and 'Inside/Outside' columns with how often they occur
+# None is a missing value
+WEAPONS = {None: 0.55, 'FIREARM': 0.2, 'KNIFE': 0.08, 'OTHER': 0.12, 'HANDS': 0.05}
+RACES = {'BLACK_OR_AFRICAN_AMERICAN': 0.6, 'WHITE': 0.2, 'ASIAN': 0.02, 'UNKNOWN': 0.08, None: 0.1}
+ETHNICITIES = {'NOT_HISPANIC_OR_LATINO': 0.5, 'HISPANIC_OR_LATINO': 0.05, 'UNKNOWN': 0.1, None: 0.35}
+PREMISE_TYPES = {'Street': 0.35, 'Row/Townhouse': 0.25, 'Parking Lot': 0.08, 'Apartment': 0.1, 'Other/Residential': 0.05, None: 0.17}
+INSIDE_OUTSIDE = {'I': 0.45, 'O': 0.45, 'Inside': 0.03, 'Outside': 0.02, None: 0.05}
+
+# Values of the 'Gender' column with how often they occur, and the odd codes the cleaning rules map to 'U'
+GENDERS = {'M': 0.45, 'F': 0.35, 'U': 0.08, None: 0.08, 'Male': 0.01, 'Female': 0.01, 'W': 0.005, 'M\\': 0.005}
+ODD_GENDERS = CLEANING_RULES['columns']['Gender']['map']['U']
+
+# Police districts with the center of their area, the neighborhoods of a district are spread around it
+DISTRICTS = {
+    'CENTRAL': (39.2950, -76.6150),
+    'EASTERN': (39.3070, -76.5900),
+    'NORTHEAST': (39.3400, -76.5700),
+    'NORTHERN': (39.3450, -76.6300),
+    'NORTHWEST': (39.3450, -76.6800),
+    'SOUTHEAST': (39.2850, -76.5650),
+    'SOUTHERN': (39.2600, -76.6250),
+    'SOUTHWEST': (39.2800, -76.6700),
+    'WESTERN': (39.3000, -76.6500),
+}
+NEIGHBORHOODS_PER_DISTRICT = 12
+
+# Streets the 'Location' addresses are made of
+STREETS = ['N CHARLES ST', 'E NORTH AVE', 'W BALTIMORE ST', 'GREENMOUNT AVE', 'E MONUMENT ST', 'PENNSYLVANIA AVE',
+           'EDMONDSON AVE', 'BELAIR RD', 'HARFORD RD', 'FREDERICK AVE', 'S HANOVER ST', 'EASTERN AVE']
+
+# Share of the rows with each kind of dirty value
+ZERO_LOCATION_SHARE = 0.01
+MISSING_LOCATION_SHARE = 0.005
+ODD_GENDER_SHARE = 0.002
+MISSING_AGE_SHARE = 0.1
+INVALID_AGE_SHARE = 0.02
+
+# Dates the crimes are spread over
+FIRST_DATE = pd.Timestamp('2011-01-01', tz='UTC')
+LAST_DATE = pd.Timestamp('2023-01-01', tz='UTC')
+
+# Number of rows generated at a time, the rows of a chunk are drawn from their own random generator
+CHUNK_ROWS = 250_000
+
+# Function to draw n values of a {value: weight} dict
+def choose(rng, weights, n):
+    values = np.empty(len(weights), dtype=object)
+    values[:] = list(weights)
+    p = np.array(list(weights.values()), dtype='float64')
+    return values[rng.choice(len(values), size=n, p=p / p.sum())]
+
+# Function to format UTC datetimes like the raw data, e.g. '2014/01/01 00:00:00+00'
+# The ISO strings numpy makes quickly are edited character by character instead of formatting every date in Python
+def format_crime_date_time(date_times):
+    iso = np.datetime_as_string(date_times.astype('datetime64[s]'), unit='s').astype('U19')
+    characters = np.empty((len(iso), 22), dtype='U1')
+    characters[:, :19] = iso.view('U1').reshape(len(iso), 19)
+    characters[:, [4, 7]] = '/'
+    characters[:, 10] = ' '
+    characters[:, 19:] = ['+', '0', '0']
+    return characters.view('U22').ravel().astype(object)
+
+# Function to generate the rows from first_row (0 based) on, the values only depend on the seed and the row numbers of the chunk
+def generate_chunk(first_row, rows, seed=0):
+    rng = np.random.default_rng([seed, first_row])
+
+    # what and when
+    codes = np.array(list(DESCRIPTIONS), dtype=object)
+    names = np.array([name for name, _ in DESCRIPTIONS.values()], dtype=object)
+    weights = np.array([weight for _, weight in DESCRIPTIONS.values()])
+    crime = rng.choice(len(codes), size=rows, p=weights / weights.sum())
+    seconds = rng.integers(0, (LAST_DATE - FIRST_DATE) // pd.Timedelta(seconds=1), rows)
+    crime_date_time = format_crime_date_time(FIRST_DATE.tz_localize(None).to_datetime64() + seconds.astype('timedelta64[s]'))
+
+    # where, every district has its neighborhoods spread around its center
+    districts = np.array(list(DISTRICTS))
+    district = rng.integers(0, len(districts), rows)
+    neighborhood = rng.integers(0, NEIGHBORHOODS_PER_DISTRICT, rows)
+    centers = np.array(list(DISTRICTS.values()))
+    latitude = centers[district, 0] + (neighborhood - NEIGHBORHOODS_PER_DISTRICT / 2) * 0.002 + rng.normal(0, 0.006, rows)
+    longitude = centers[district, 1] + (neighborhood % 4 - 1.5) * 0.004 + rng.normal(0, 0.008, rows)
+    latitude, longitude = latitude.round(8), longitude.round(8)
+
+    # crimes without a location have 0 or no coordinates
+    zero_location = rng.random(rows) < ZERO_LOCATION_SHARE
+    latitude[zero_location] = 0
+    longitude[zero_location] = 0
+    missing_location = rng.random(rows) < MISSING_LOCATION_SHARE
+    latitude[missing_location] = np.nan
+    longitude[missing_location] = np.nan
+
+    # who, with odd gender codes and ages that are missing, 0 or below, 115 or over, or not whole numbers
+    gender = choose(rng, GENDERS, rows)
+    odd_gender = rng.random(rows) < ODD_GENDER_SHARE
+    gender[odd_gender] = np.array(ODD_GENDERS, dtype=object)[rng.integers(0, len(ODD_GENDERS), odd_gender.sum())]
+    age = rng.gamma(4.0, 8.0, rows).round()
+    invalid_age = rng.random(rows) < INVALID_AGE_SHARE
+    age[invalid_age] = rng.choice([-5, -1, 0, 115, 120, 999, 0.5, 23.5], size=invalid_age.sum())
+    age[rng.random(rows) < MISSING_AGE_SHARE] = np.nan
+
+    row_id = np.arange(first_row + 1, first_row + rows + 1)
+    district_names = districts[district]
+    neighborhood_names = pd.Series(district_names).str.cat(neighborhood.astype(str), sep=' ')
+    geo_location = ('(' + pd.Series(latitude).astype(str) + ',' + pd.Series(longitude).astype(str) + ')').to_numpy()
+    geo_location[missing_location] = None
+
+    return pd.DataFrame({
+        'X': (1_420_000 + (longitude + 76.61) * 290_000).round(4),
+        'Y': (590_000 + (latitude - 39.29) * 364_000).round(4),
+        'RowID': row_id,
+        'CCNumber': pd.Series(row_id % 100_000_000).astype(str).str.zfill(8).radd('1' + str(seed % 10) + 'A').to_numpy(),
+        'CrimeDateTime': crime_date_time,
+        'CrimeCode': codes[crime],
+        'Description': names[crime],
+        'Inside/Outside': choose(rng, INSIDE_OUTSIDE, rows),
+        'Weapon': choose(rng, WEAPONS, rows),
+        'Post': rng.integers(111, 946, rows),
+        'Gender': gender,
+        'Age': age,
+        'Race': choose(rng, RACES, rows),
+        'Ethnicity': choose(rng, ETHNICITIES, rows),
+        'Location': (pd.Series(rng.integers(1, 40, rows) * 100).astype(str) + ' '
+                     + np.array(STREETS, dtype=object)[rng.integers(0, len(STREETS), rows)]).to_numpy(),
+        'Old_District': district_names,
+        'New_District': district_names,
+        'Neighborhood': neighborhood_names.to_numpy(),
+        'Latitude': latitude,
+        'Longitude': longitude,
+        'GeoLocation': geo_location,
+        'PremiseType': choose(rng, PREMISE_TYPES, rows),
+        'Total_Incidents': 1,
+    }, columns=RAW_COLUMNS)
+
+# Function to write rows of synthetic raw data to a CSV file, chunk by chunk so any number of rows fits in memory
+def write_synthetic_data(path, rows, seed=0):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for first_row in range(0, rows, CHUNK_ROWS):
+            chunk = generate_chunk(first_row, min(CHUNK_ROWS, rows - first_row), seed)
+            chunk.to_csv(f, header=first_row == 0, index=False)
+        if rows == 0:
+            pd.DataFrame(columns=RAW_COLUMNS).to_csv(f, index=False)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate synthetic raw crime data")
+    parser.add_argument('rows', help="number of rows, or one of " + ", ".join(SIZES))
+    parser.add_argument('path')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rows = SIZES[args.rows.lower()] if args.rows.lower() in SIZES else int(args.rows)
+    start = time.perf_counter()
+    write_synthetic_data(args.path, rows, args.seed)
+    print(f"wrote {rows} rows to {args.path} in {time.perf_counter() - start:.2f} seconds")
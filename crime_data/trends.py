@@ -0,0 +1,186 @@
+# Description: This file contains the functions to compute the crime trends per area.
+# The crimes are counted per day, area ('New_District' or 'Neighborhood') and 'Description', and for every
+# (area, Description) the counts are kept as a running total at the days it has crimes on, so the engine grows with the
+# counts and not with the days between the earliest and the latest crime. The number of crimes of any window of days
+# is then the difference of two running totals, so moving counts and week over week changes cost the same for a window
+# of 7 days as for one of 10 years, and the days of new data are added after the running totals of their series.
+
+import numpy as np
+import pandas as pd
+
+from crime_data.crime_stats import to_utc_timestamp
+
+# Version of the trend counts; bump it whenever they change so persisted counts are rebuilt
+TREND_VERSION = 1
+
+# Columns of the cleaned data the trends are computed per
+AREA_COLUMNS = ['New_District', 'Neighborhood']
+
+# Windows of the moving counts, in days
+TREND_WINDOWS = [7, 28, 90]
+
+# Number of bits of the day in the key of a running total, the series is in the bits above them
+DAY_BITS = 32
+DAY_MASK = (1 << DAY_BITS) - 1
+
+# Function to count the crimes per area column, day, area and 'Description'
+# Returns a DataFrame with the 'AreaColumn', 'Day', 'Area', 'Description' and 'count' columns, sorted on them
+def build_trend_counts(data):
+    day = data['CrimeDateTime'].dt.floor('D').rename('Day')
+    tables = []
+    for column in AREA_COLUMNS:
+        counts = data.groupby([day, data[column].rename('Area'), data['Description']], observed=True, sort=True).size()
+        counts = counts.rename('count').astype('int32').reset_index()
+        counts['Area'] = counts['Area'].astype(str)
+        counts.insert(0, 'AreaColumn', column)
+        tables.append(counts)
+    trend_counts = pd.concat(tables, ignore_index=True)
+    return trend_counts.sort_values(['AreaColumn', 'Day', 'Area', 'Description'], kind='stable', ignore_index=True)
+
+# Function to return the counts of one area column, with the 'Area' and 'Description' as strings
+def area_counts(trend_counts, area_column):
+    counts = trend_counts[trend_counts['AreaColumn'] == area_column].drop(columns='AreaColumn')
+    return counts.astype({'Area': str, 'Description': str}).reset_index(drop=True)
+
+# Function to return the keys of the running totals, sorted on the series and then the day
+def total_keys(codes, days):
+    return (np.asarray(codes, dtype='int64') << DAY_BITS) | np.asarray(days, dtype='int64')
+
+# Function to return the running total of every series after each of its days
+# codes and counts are the series and the count of each day, sorted on the series
+def running_totals(codes, counts):
+    if not len(codes):
+        return np.zeros(0, dtype='int32')
+    totals = np.cumsum(counts, dtype='int64')
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    before = np.repeat(totals[starts] - counts[starts], np.diff(np.r_[starts, len(codes)]))
+    return (totals - before).astype('int32')
+
+# Function to return the running totals of series before a day (or a day per series), numbered from the first day
+def totals_before(engine, codes, day):
+    codes = np.asarray(codes, dtype='int64')
+    if not len(engine['keys']):
+        return np.zeros(len(codes), dtype='int64')
+    # the last running total before the day, unless it belongs to the series before
+    positions = np.searchsorted(engine['keys'], total_keys(codes, day)) - 1
+    found = (positions >= 0) & (engine['keys'][positions] >> DAY_BITS == codes)
+    return np.where(found, engine['totals'][positions], 0)
+
+# Function to return the series, days (numbered from the first day) and counts of trend counts, sorted on the series and day
+def sorted_days(engine, counts, codes):
+    days = (counts['Day'] - engine['first_day']).dt.days.to_numpy()
+    order = np.lexsort((days, codes))
+    return codes[order], days[order], counts['count'].to_numpy()[order]
+
+# Function to build the trend engine of an area column from the trend counts
+# Returns a dict with the 'series' (a MultiIndex of 'Area' and 'Description'), the 'first_day', the number of days
+# ('length') and for every day a series has crimes on, sorted on the series and the day: the 'keys' (the series code
+# and the day, see total_keys()), the crimes of the day ('daily') and the running total of the series after it ('totals')
+def build_trend_engine(trend_counts, area_column):
+    counts = area_counts(trend_counts, area_column)
+    engine = {'area_column': area_column, 'series': pd.MultiIndex.from_arrays([[], []], names=['Area', 'Description']),
+              'first_day': None, 'length': 0, 'counts': counts, 'keys': np.zeros(0, dtype='int64'),
+              'daily': np.zeros(0, dtype='int32'), 'totals': np.zeros(0, dtype='int32')}
+    if not len(counts):
+        return engine
+
+    codes, series = pd.MultiIndex.from_frame(counts[['Area', 'Description']]).factorize(sort=True)
+    engine['series'] = series.set_names(['Area', 'Description'])
+    engine['first_day'] = counts['Day'].iloc[0]
+    codes, days, daily = sorted_days(engine, counts, codes)
+    engine['length'] = int(days.max()) + 1
+    engine['keys'], engine['daily'], engine['totals'] = total_keys(codes, days), daily.astype('int32'), running_totals(codes, daily)
+    return engine
+
+# Function to add the counts of days after the last day of the engine to it, in place
+def append_trend_days(engine, counts):
+    if not len(counts):
+        return engine
+
+    # series seen for the first time had no crimes on the days before
+    new_series = pd.MultiIndex.from_frame(counts[['Area', 'Description']])
+    engine['series'] = engine['series'].append(new_series).unique()
+    codes, days, daily = sorted_days(engine, counts, engine['series'].get_indexer(new_series))
+    totals = running_totals(codes, daily) + totals_before(engine, codes, engine['length'])
+
+    # the new days come after the days of their series, so they are inserted without sorting the keys again
+    positions = np.searchsorted(engine['keys'], total_keys(codes, days))
+    engine['keys'] = np.insert(engine['keys'], positions, total_keys(codes, days))
+    engine['daily'] = np.insert(engine['daily'], positions, daily.astype('int32'))
+    engine['totals'] = np.insert(engine['totals'], positions, totals.astype('int32'))
+    engine['length'] = max(engine['length'], int(days.max()) + 1)
+    engine['counts'] = pd.concat([engine['counts'], counts], ignore_index=True)
+    return engine
+
+# Function to bring a trend engine up to date with new trend counts
+# Only the days after the last day of the engine are added when the counts of the earlier days did not change,
+# otherwise (e.g. changed crimes of earlier days) the engine is built again
+def update_trend_engine(engine, trend_counts, area_column):
+    if engine is None or engine['first_day'] is None:
+        return build_trend_engine(trend_counts, area_column)
+
+    counts = area_counts(trend_counts, area_column)
+    last_day = engine['first_day'] + pd.Timedelta(days=engine['length'] - 1)
+    split = counts['Day'].searchsorted(last_day, side='right')
+    if not counts.iloc[:split].equals(engine['counts']):
+        return build_trend_engine(trend_counts, area_column)
+    return append_trend_days(engine, counts.iloc[split:].reset_index(drop=True))
+
+# Function to return the rows of the series in the areas and crimes, None for all of them
+def series_rows(engine, areas=None, crimes=None):
+    rows = np.ones(len(engine['series']), dtype=bool)
+    if areas is not None:
+        rows &= engine['series'].get_level_values('Area').isin([str(area) for area in areas])
+    if crimes is not None:
+        rows &= engine['series'].get_level_values('Description').isin([str(crime) for crime in crimes])
+    return rows
+
+# Function to return the position of the running total before a day, clipped to the days of the engine
+def total_position(engine, day):
+    position = (to_utc_timestamp(day).floor('D') - engine['first_day']).days
+    return min(max(position, 0), engine['length'])
+
+# Function to return the number of crimes of every series in the window of days ending with end_day (included)
+def window_counts(engine, end_day, window, rows=None):
+    codes = np.arange(len(engine['series'])) if rows is None else np.flatnonzero(rows)
+    if engine['first_day'] is None:
+        return np.zeros(len(codes), dtype='int64')
+    end = total_position(engine, to_utc_timestamp(end_day) + pd.Timedelta(days=1))
+    start = max(end - window, 0)
+    return totals_before(engine, codes, end) - totals_before(engine, codes, start)
+
+# Function to return the moving counts of the crimes in the areas and crimes, for every day between the from_date and to_date
+# Returns a DataFrame indexed by 'Day' with a column per window, e.g. '7 days'
+def moving_counts(engine, from_date, to_date, areas=None, crimes=None, windows=TREND_WINDOWS):
+    if engine['first_day'] is None:
+        return pd.DataFrame(columns=['%d days' % window for window in windows])
+    start, end = total_position(engine, from_date), total_position(engine, to_date)
+    ends = np.arange(start, end) + 1
+
+    # the running total of a sum of series is the sum of their crimes, only the days of the windows are counted per day
+    first = max(start + 1 - max(windows), 0)
+    selected = series_rows(engine, areas, crimes)[engine['keys'] >> DAY_BITS]
+    days, daily = engine['keys'][selected] & DAY_MASK, engine['daily'][selected]
+    counted = (days >= first) & (days < end)
+    totals = np.zeros(end - first + 1, dtype='int64')
+    totals[0] = daily[days < first].sum()
+    totals[1:] = totals[0] + np.cumsum(np.bincount(days[counted] - first, weights=daily[counted], minlength=end - first)).astype('int64')
+
+    days = pd.DatetimeIndex(engine['first_day'] + pd.to_timedelta(ends - 1, unit='D'), name='Day')
+    return pd.DataFrame({'%d days' % window: totals[ends - first] - totals[np.maximum(ends - window, 0) - first] for window in windows}, index=days)
+
+# Function to return the (area, Description) series whose count changed the most from the window before
+# the window ending with end_day to that window, e.g. week over week with window=7
+# Returns a DataFrame with the 'Area', 'Description', 'Current', 'Previous', 'Change' and 'Percent Change' columns
+def biggest_movers(engine, end_day, window=7, limit=20, crimes=None):
+    rows = series_rows(engine, crimes=crimes)
+    current = window_counts(engine, end_day, window, rows)
+    previous = window_counts(engine, to_utc_timestamp(end_day) - pd.Timedelta(days=window), window, rows)
+
+    movers = engine['series'][rows].to_frame(index=False)
+    movers['Current'] = current
+    movers['Previous'] = previous
+    movers['Change'] = current - previous
+    movers['Percent Change'] = np.where(previous > 0, 100 * movers['Change'] / np.maximum(previous, 1), np.nan).round(1)
+    order = np.argsort(-np.abs(movers['Change'].to_numpy()), kind='stable')
+    return movers.iloc[order[:limit]].reset_index(drop=True)
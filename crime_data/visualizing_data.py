@@ -0,0 +1,416 @@
+# Description: This file contains the functions to visualize the data
+# The map libraries are only imported by the map modes that draw with them, and the cube, grid and spatial index
+# are only loaded when they are first needed, so the app starts without paying for the parts it does not show.
+
+import threading
+
+import streamlit as st
+import pandas as pd
+
+from crime_data.batch import read_map_artifact, read_window_tables
+from crime_data.boundaries import BOUNDARIES_PATH, count_by_area, load_boundaries
+from crime_data.crime_cube import count_by, query_crime_cube, roll_up
+from crime_data.crime_stats import filter_date_range, get_crime_percents, to_utc_timestamp
+from crime_data.data_cache import cleaned_data_version, current_data_version, load_cleaned_data, load_crime_cube, load_heat_bins, load_spatial_grid, load_trend_counts
+from crime_data.heatmap import heat_raster
+from crime_data.incident_table import PAGE_SIZES, RANGE_FILTER_COLUMNS, TABLE_COLUMNS, VALUE_FILTER_COLUMNS, get_incident_page, page_count
+from crime_data.prefetch import cancel_batch, new_batch, submit_task, wait_for, warm_task
+from crime_data.profiling import profile_stage, profiled, summarize_run
+from crime_data.shared_store import open_shared_data, publish_shared_data
+from crime_data.spatial_grid import STREET_LEVEL_ZOOM, filter_bounds, query_grid
+from crime_data.trends import AREA_COLUMNS, TREND_WINDOWS, biggest_movers, moving_counts, update_trend_engine
+
+# Ways the crimes can be drawn on the map, the grid only sends the cells in the viewport to the browser,
+# the heatmap sends a single image and the choropleth one shape per area
+MAP_MODES = ['Grid', 'Heatmap', 'Choropleth', 'Markers', 'Click Query']
+
+# Number of other crime types whose maps are rendered ahead, see crime_data.prefetch
+PREFETCH_CRIME_TYPES = 3
+
+# Function to return the cleaned data and its version, kept in memory across reruns
+# data_key is data_cache.cleaned_data_key(), the data is only loaded again when the raw data, cleaning rules or cache change
+# The raw CSV is only cleaned again (in chunks) when it or the cleaning rules change, new and changed rows are merged in
+# The data is memory-mapped from the published version of the cache (e.g. by python -m crime_data.batch), so the app
+# processes share one copy of it; the cache is only loaded when it is out of date or its version was not published
+@st.cache_resource(max_entries=1)
+def get_cleaned_data(data_key):
+    data_version = current_data_version()
+    shared = open_shared_data(version=data_version) if data_version is not None else None
+    if shared is None:
+        cleaned_data = load_cleaned_data(streaming=True, incremental=True)
+        data_version = cleaned_data_version()
+        publish_shared_data(cleaned_data, data_version)
+        # the loaded copy is only used when another process swapped in a newer version in the meantime
+        shared = open_shared_data(version=data_version) or (cleaned_data, data_version)
+    return shared
+
+# Function to return the day x Description x Weapon x PremiseType x Gender count cube the charts are built from
+@st.cache_resource(max_entries=1)
+def get_crime_cube(data_version, _cleaned_data):
+    return load_crime_cube(_cleaned_data)
+
+# Function to return the map grid with the crimes counted per day, cell and Description at several zoom levels
+@st.cache_resource(max_entries=1)
+def get_spatial_grid(data_version, _cleaned_data):
+    return load_spatial_grid(_cleaned_data)
+
+# Function to return the heatmap bins with the crimes counted per month, cell and Description
+@st.cache_resource(max_entries=1)
+def get_heat_bins(data_version, _cleaned_data):
+    return load_heat_bins(_cleaned_data)
+
+# Function to return the trend engines shared by all sessions, and the lock to update them with
+@st.cache_resource
+def trend_engines():
+    return {'lock': threading.Lock(), 'version': None, 'engines': {}}
+
+# Function to return the trend engine of every area column
+# When the data changes only by new days, the days are added to the engines in place instead of building them again
+def get_trend_engines(data_version, cleaned_data):
+    shared = trend_engines()
+    with shared['lock']:
+        if shared['version'] != data_version:
+            trend_counts = load_trend_counts(cleaned_data)
+            shared['engines'] = {column: update_trend_engine(shared['engines'].get(column), trend_counts, column) for column in AREA_COLUMNS}
+            shared['version'] = data_version
+        return shared['engines']
+
+# Function to return the spatial index of the cleaned data, it is only built when a click query first needs it
+@st.cache_resource(max_entries=1)
+def get_spatial_index(data_version, _cleaned_data):
+    from crime_data.spatial_index import build_spatial_index
+    return build_spatial_index(_cleaned_data)
+
+# A function that provides user input for the date range and crime type
+def user_input(cleaned_data):
+    # create a sidebar
+    st.sidebar.header("User Input")
+    # create a date range slider
+    from_date = st.sidebar.date_input('From Date', pd.to_datetime('2014/01/01 00:00:00+00'), min_value=pd.to_datetime('2014/01/01 00:00:00+00'))
+    to_date = st.sidebar.date_input('To Date', pd.to_datetime('2015/01/01 00:00:00+00'), min_value=pd.to_datetime('2015/01/01 00:00:00+00'))
+    # create a dropdown menu for the crime type
+    crime = st.sidebar.selectbox("Crime Type", cleaned_data['Description'].unique())
+    # create a dropdown menu for how the crimes are drawn on the map
+    map_mode = st.sidebar.selectbox("Map Mode", MAP_MODES)
+    return from_date, to_date, crime, map_mode
+
+# Function to return the viewport of the map from the output of st_folium, as the zoom, center and (south, west, north, east) bounds
+def map_view(map_state):
+    if not map_state or map_state.get('zoom') is None:
+        return None
+    bounds = map_state.get('bounds') or {}
+    south_west, north_east = bounds.get('_southWest') or {}, bounds.get('_northEast') or {}
+    if None in (south_west.get('lat'), south_west.get('lng'), north_east.get('lat'), north_east.get('lng')):
+        return None
+    center = map_state.get('center') or {}
+    return {
+        'zoom': int(map_state['zoom']),
+        'center': [round(center['lat'], 5), round(center['lng'], 5)] if center else None,
+        'bounds': tuple(round(value, 5) for value in (south_west['lat'], south_west['lng'], north_east['lat'], north_east['lng'])),
+    }
+
+# Function to display the map of the grid cells in the viewport, or of the crimes themselves at street level
+def display_grid_map(cleaned_data, spatial_grid, from_date, to_date, crime):
+    from streamlit_folium import st_folium
+    from crime_data.crime_map import build_crime_map, build_grid_map
+
+    # the viewport of the map the last time the user moved it
+    view = st.session_state.get('map_view', {'zoom': 12, 'center': None, 'bounds': None})
+
+    if view['zoom'] >= STREET_LEVEL_ZOOM and view['bounds'] is not None:
+        crimes = profiled('filter_bounds', filter_bounds, cleaned_data, view['bounds'])
+        crime_map = profiled('build_crime_map', build_crime_map, crimes, crime, view['center'], view['zoom'])
+    else:
+        cells = profiled('query_grid', query_grid, spatial_grid, view['zoom'], from_date, to_date, view['bounds'])
+        crime_map = profiled('build_grid_map', build_grid_map, cells, crime, view['center'], view['zoom'])
+
+    with profile_stage('st_folium'):
+        map_state = st_folium(crime_map, key='crime_map', height=500, use_container_width=True, returned_objects=['bounds', 'zoom', 'center'])
+
+    # when the user moved the map, draw it again for the new viewport
+    new_view = map_view(map_state)
+    if new_view is not None and new_view != view:
+        st.session_state['map_view'] = new_view
+        st.rerun()
+
+# Function to display the incidents of the data one page at a time, the sort and filters are applied on the server
+# so only the rows of the page are sent to the browser; key tells apart the widgets of different tables
+def display_incident_table(data, key):
+    with st.expander("Sort and Filter"):
+        sort_by = st.selectbox('Sort by', TABLE_COLUMNS, key=key + '_sort_by')
+        ascending = st.radio('Order', ['Ascending', 'Descending'], horizontal=True, key=key + '_order') == 'Ascending'
+        page_size = st.selectbox('Rows per page', PAGE_SIZES, index=2, key=key + '_page_size')
+
+        filters = {}
+        for column in VALUE_FILTER_COLUMNS:
+            values = st.multiselect(column, [str(value) for value in data[column].cat.categories], key=key + '_' + column)
+            if values:
+                filters[column] = values
+        for column in RANGE_FILTER_COLUMNS:
+            values = data[column].dropna()
+            if not len(values):
+                continue
+            low, high = float(values.min()), float(values.max())
+            if low < high:
+                selected = st.slider(column, low, high, (low, high), key=key + '_' + column)
+                if selected != (low, high):
+                    filters[column] = selected
+
+    # go back to the first page whenever the sort or the filters change
+    page_key = key + '_page'
+    query = (sort_by, ascending, page_size, repr(sorted(filters.items())))
+    if st.session_state.get(key + '_query') != query:
+        st.session_state[key + '_query'] = query
+        st.session_state[page_key] = 1
+    page = st.session_state.setdefault(page_key, 1)
+
+    page_rows, total = profiled('get_incident_page', get_incident_page, data, page - 1, page_size, sort_by, ascending, filters)
+    pages = page_count(total, page_size)
+    if page > pages:
+        # the data got smaller since the page was chosen, e.g. a shorter date range
+        page = st.session_state[page_key] = pages
+        page_rows, total = profiled('get_incident_page', get_incident_page, data, page - 1, page_size, sort_by, ascending, filters)
+
+    with profile_stage('table', len(page_rows)):
+        st.dataframe(page_rows, hide_index=True)
+    st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+    first_row = (page - 1) * page_size
+    st.caption(f"Rows {min(first_row + 1, total)} to {first_row + len(page_rows)} of {total}")
+
+# Function to display a map where a click lists the crimes within a radius of the clicked point
+# all_data is the data the spatial index was built on, the query already applies the date range
+def display_click_query_map(all_data, spatial_index, from_date, to_date, crime):
+    import folium
+    from streamlit_folium import st_folium
+    from crime_data.crime_map import build_crime_map
+    from crime_data.spatial_index import radius_query
+
+    radius = st.sidebar.slider('Query Radius (m)', min_value=100, max_value=2000, value=500, step=100)
+    only_crime = st.sidebar.checkbox('Only the selected Crime Type')
+
+    # the point the user clicked on the last time
+    clicked = st.session_state.get('clicked_point')
+    if clicked is None:
+        found = all_data.iloc[:0]
+        crime_map = build_crime_map(found, crime)
+    else:
+        positions = profiled('radius_query', radius_query, spatial_index, clicked[0], clicked[1], radius, [crime] if only_crime else None, from_date, to_date)
+        found = all_data.iloc[positions]
+        crime_map = profiled('build_crime_map', build_crime_map, found, crime, list(clicked), 15)
+        folium.Circle(list(clicked), radius=radius, color='red', fill=False).add_to(crime_map)
+
+    with profile_stage('st_folium'):
+        map_state = st_folium(crime_map, key='click_query_map', height=500, use_container_width=True, returned_objects=['last_clicked'])
+
+    # when the user clicked somewhere else, query again around the new point
+    last_clicked = (map_state or {}).get('last_clicked')
+    if last_clicked:
+        point = (round(last_clicked['lat'], 6), round(last_clicked['lng'], 6))
+        if point != clicked:
+            st.session_state['clicked_point'] = point
+            st.rerun()
+
+    if clicked is None:
+        st.write("Click on the map to list the crimes around that point")
+    else:
+        st.write(f"{len(found)} crimes within {radius} m of {clicked[0]}, {clicked[1]}")
+        display_incident_table(found, 'click_query_table')
+
+# Function to return the map task of the heatmap, see display_rendered_map()
+def heat_map_task(heat_bins, data_version, all_crimes):
+    def map_task(from_date, to_date, crime):
+        from crime_data.crime_map import build_heat_map
+
+        map_key = (data_version, from_date, to_date, None if all_crimes else crime, 'Heatmap')
+        return map_key, lambda: build_heat_map(heat_raster(heat_bins, from_date, to_date, None if all_crimes else [crime]))
+    return map_task
+
+# Function to display the density heatmap of the selected crime or of all crimes between the from_date and to_date
+# Only the monthly bins are summed, so changing the crime type or date range does not go through the crimes again
+def display_heat_map(heat_bins, data_version, from_date, to_date, crime, crimes):
+    all_crimes = st.sidebar.radio("Heatmap Crimes", ['Selected crime type', 'All crime types']) == 'All crime types'
+    display_rendered_map(heat_map_task(heat_bins, data_version, all_crimes), (data_version, 'Heatmap', all_crimes),
+                         from_date, to_date, crime, crimes)
+    st.caption("The heatmap counts the crimes per month, a date range starting or ending inside a month includes the whole month")
+
+# Function to display the moving number of crimes of the selected crime in an area, and the areas and crimes
+# whose number changed the most from the window before the to_date to the window before that
+def display_trends(engines, from_date, to_date, crime):
+    st.write("Moving Number of Crimes per Area and Biggest Movers")
+    col1, col2 = st.columns(2)
+
+    area_column = col1.radio("Area", AREA_COLUMNS, horizontal=True, key='trend_area_column')
+    engine = engines[area_column]
+    areas = sorted(engine['series'].get_level_values('Area').unique())
+    area = col1.selectbox(area_column, ['All'] + areas, key='trend_area')
+    trend = profiled('moving_counts', moving_counts, engine, from_date, to_date, None if area == 'All' else [area], [crime])
+    with profile_stage('line_chart', len(trend)):
+        col1.line_chart(trend)
+
+    window = col2.selectbox("Window", TREND_WINDOWS, format_func=lambda days: '%d days' % days, key='trend_window')
+    end_day = to_utc_timestamp(to_date) - pd.Timedelta(days=1)
+    movers = profiled('biggest_movers', biggest_movers, engine, end_day, window)
+    col2.caption(f"The {window} days up to {end_day.date()} compared with the {window} days before")
+    col2.dataframe(movers, hide_index=True)
+
+# Function to return the map task of the choropleth, see display_rendered_map()
+def choropleth_map_task(all_data, boundaries, data_version, all_crimes):
+    def map_task(from_date, to_date, crime):
+        from crime_data.crime_map import build_choropleth_map
+
+        map_key = (data_version, from_date, to_date, None if all_crimes else crime, 'Choropleth')
+        def build_map():
+            area_counts = count_by_area(filter_date_range(all_data, from_date, to_date), None if all_crimes else [crime])
+            return build_choropleth_map(boundaries, area_counts)
+        return map_key, build_map
+    return map_task
+
+# Function to display the number of crimes per area of the boundaries file between the from_date and to_date
+# The crimes were assigned to the areas when they were cleaned, so the counts are a bincount of the area codes
+def display_choropleth_map(all_data, data_version, from_date, to_date, crime, crimes):
+    boundaries = load_boundaries()
+    if boundaries is None:
+        st.info(f"There is no boundaries file at {BOUNDARIES_PATH}, set CRIME_DATA_BOUNDARIES to a GeoJSON file of the "
+                "districts or neighborhoods to count the crimes per area")
+        return
+
+    all_crimes = st.sidebar.radio("Choropleth Crimes", ['Selected crime type', 'All crime types']) == 'All crime types'
+    display_rendered_map(choropleth_map_task(all_data, boundaries, data_version, all_crimes), (data_version, 'Choropleth', all_crimes),
+                         from_date, to_date, crime, crimes)
+
+# Function to return the map task of the marker map, see display_rendered_map()
+def marker_map_task(all_data, data_version):
+    def map_task(from_date, to_date, crime):
+        from crime_data.crime_map import build_crime_map
+
+        map_key = (data_version, from_date, to_date, crime, 'Markers')
+        return map_key, lambda: build_crime_map(filter_date_range(all_data, from_date, to_date), crime)
+    return map_task
+
+# Function to return the filter states the user is likely to pick next as (from_date, to_date, crime):
+# the most common other crime types of the date range first, then the date ranges of the same length before and after it
+# crimes is the list of crime types, most common first
+def next_filter_states(from_date, to_date, crime, crimes, limit=PREFETCH_CRIME_TYPES):
+    states = [(from_date, to_date, other) for other in crimes if other != crime][:limit]
+    length = to_date - from_date
+    if length.days > 0:
+        states += [(from_date - length, from_date, crime), (to_date, to_date + length, crime)]
+    return states
+
+# Function to return the batch of background work of the filter state of the session
+# The batch of the previous filter state is cancelled when the state changes, not on reruns for other widgets
+def prefetch_batch(state):
+    if st.session_state.get('prefetch_state') != state:
+        if 'prefetch_batch' in st.session_state:
+            cancel_batch(st.session_state['prefetch_batch'])
+        st.session_state['prefetch_batch'] = new_batch()
+        st.session_state['prefetch_state'] = state
+    return st.session_state['prefetch_batch']
+
+# Function to display a rendered map and render the maps of the likely next filter states ahead
+# map_task(from_date, to_date, crime) returns the key of the map in the map cache and the function that builds it
+# The map is built on a worker thread while the rest of the page is already shown, a change of input stops the wait
+def display_rendered_map(map_task, state, from_date, to_date, crime, crimes):
+    import streamlit.components.v1 as components
+    from crime_data.crime_map import cached_map, get_rendered_map
+
+    batch = prefetch_batch(state + (from_date, to_date, crime))
+    map_key, build_map = map_task(from_date, to_date, crime)
+    source_code = cached_map(map_key)
+    if source_code is None:
+        placeholder = st.empty()
+        with profile_stage('wait_for_map'):
+            future = submit_task(map_key, lambda: get_rendered_map(map_key, build_map), batch)
+            source_code = wait_for(future, lambda: placeholder.caption("Rendering the map..."))
+            # the work was dropped with a cancelled batch before it started, build the map here
+            if source_code is None:
+                source_code = get_rendered_map(map_key, build_map)
+        placeholder.empty()
+    with profile_stage('components_html'):
+        components.html(source_code, height=500)
+
+    for next_state in next_filter_states(from_date, to_date, crime, crimes):
+        next_key, next_build = map_task(*next_state)
+        if cached_map(next_key) is None:
+            warm_task(next_key, lambda key=next_key, build=next_build: get_rendered_map(key, build), batch)
+
+# Display the data
+def display_data(cleaned_data, data_version, from_date, to_date, crime, map_mode):
+
+    # keep all the data, the spatial index refers to its rows
+    all_data = cleaned_data
+
+    # focus on the rows with 'CrimeDatetime' between the from_date and to_date
+    cleaned_data = profiled('filter_date_range', filter_date_range, cleaned_data, from_date, to_date)
+
+    # the charts of a date window precomputed by python -m crime_data.batch are read as they are,
+    # the others are answered from the cube cells of the days between the from_date and to_date
+    window_tables = profiled('read_window_tables', read_window_tables, from_date, to_date, data_version)
+    if window_tables is None:
+        crime_cube = profiled('get_crime_cube', get_crime_cube, data_version, all_data)
+        cube_cells = profiled('query_crime_cube', query_crime_cube, crime_cube, from_date, to_date)
+        crimes_per_type = profiled('count_by', count_by, cube_cells, 'Description')
+        # roll the cube up to months, the percent of each crime to all crimes per month is derived from it
+        crime_counts = profiled('roll_up', roll_up, cube_cells, 'MS')
+        crime_percents = profiled('get_crime_percents', get_crime_percents, crime_counts)
+    else:
+        crimes_per_type, crime_counts, crime_percents = window_tables
+
+    st.write("Cleaned Data and Number of Crimes per Crime Type")
+    col1, col2 = st.columns(2)
+    with col1:
+        display_incident_table(cleaned_data, 'incident_table')
+    with profile_stage('bar_chart', len(crimes_per_type)):
+        col2.bar_chart(crimes_per_type, height=500)
+
+    st.write("Number of Crimes per Month and Percent of Each Crime to All Crimes per Month")
+    col1, col2 = st.columns(2)
+    with profile_stage('area_charts', len(crime_counts)):
+        col1.area_chart(crime_counts.sum(axis=1))
+        col2.area_chart(crime_percents)
+
+    # the crime types of the date range, most common first, are the ones whose maps are rendered ahead
+    crimes = list(crimes_per_type.sort_values(ascending=False, kind='stable').index)
+
+    trend_engines = profiled('get_trend_engines', get_trend_engines, data_version, all_data)
+    display_trends(trend_engines, from_date, to_date, crime)
+
+    if map_mode == 'Grid':
+        spatial_grid = profiled('get_spatial_grid', get_spatial_grid, data_version, all_data)
+        display_grid_map(cleaned_data, spatial_grid, from_date, to_date, crime)
+        return
+    if map_mode == 'Heatmap':
+        heat_bins = profiled('get_heat_bins', get_heat_bins, data_version, all_data)
+        display_heat_map(heat_bins, data_version, from_date, to_date, crime, crimes)
+        return
+    if map_mode == 'Choropleth':
+        display_choropleth_map(all_data, data_version, from_date, to_date, crime, crimes)
+        return
+    if map_mode == 'Click Query':
+        spatial_index = profiled('get_spatial_index', get_spatial_index, data_version, all_data)
+        display_click_query_map(all_data, spatial_index, from_date, to_date, crime)
+        return
+
+    # create map with a clustered marker for every crime, the markers of the selected crime are red
+    # a map precomputed by python -m crime_data.batch is read as it is, the others are rendered here
+    # the rendered HTML is kept in memory, so going back to earlier filter settings does not build the map again
+    source_code = profiled('read_map_artifact', read_map_artifact, from_date, to_date, crime, data_version)
+    if source_code is None:
+        display_rendered_map(marker_map_task(all_data, data_version), (data_version, 'Markers'), from_date, to_date, crime, crimes)
+        return
+    import streamlit.components.v1 as components
+    with profile_stage('components_html'):
+        components.html(source_code, height=500)
+
+# Function to display the stages of a profiled run (see crime_data.profiling) in an optional sidebar panel
+def display_performance_panel(run):
+    if run is None or not st.sidebar.checkbox('Show performance'):
+        return
+
+    stages = pd.DataFrame(summarize_run(run))
+    with st.sidebar.expander("Performance", expanded=True):
+        st.write(f"Run took {run['seconds']:.3f} s")
+        if len(stages):
+            # indent the stages run inside another stage
+            stages['stage'] = [' ' * 4 * depth + stage for stage, depth in zip(stages['stage'], stages['depth'])]
+            st.dataframe(stages.drop(columns='depth'), hide_index=True)
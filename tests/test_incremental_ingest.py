@@ -0,0 +1,72 @@
+# Description: This file contains the tests of the incremental refresh of the cached cleaned data.
+# A cache is built from synthetic raw data, the raw data is changed (new, changed, newly dropped and retracted rows)
+# and the refreshed cache must hold the same crimes and counts as cleaning the changed raw data from scratch.
+
+import pandas as pd
+
+from crime_data.cleaning_data import clean_data
+from crime_data.crime_cube import build_crime_cube
+from crime_data.data_cache import load_cleaned_data, load_crime_cube, read_manifest
+from crime_data.incremental_ingest import apply_delta
+from crime_data.synthetic_data import generate_chunk
+
+# Number of rows of the synthetic raw data
+ROWS = 5_000
+
+# Function to return the crimes of cleaned data sorted on 'RowID', without the row numbers and unused categories
+def comparable(cleaned_data):
+    cleaned_data = cleaned_data.sort_values('RowID', kind='stable').reset_index(drop=True)
+    for column in cleaned_data.select_dtypes('category'):
+        cleaned_data[column] = cleaned_data[column].cat.remove_unused_categories()
+    return cleaned_data
+
+# Function to return a count table sorted on its keys, without unused categories
+def comparable_counts(table):
+    keys = [column for column in table.columns if column != 'count']
+    table = table.astype({column: str for column in keys if str(table[column].dtype) == 'category'})
+    return table.sort_values(keys, kind='stable', ignore_index=True)
+
+# Function to change the raw data: edit some rows, give some rows a zero latitude, retract some and add new ones
+def changed_raw_data(raw):
+    raw = raw.copy()
+    raw.loc[100:149, 'Description'] = 'BURGLARY'
+    raw.loc[200:219, 'Latitude'] = 0
+    raw = raw.drop(index=range(300, 400))
+    new_rows = generate_chunk(ROWS, 200, seed=1)
+    return pd.concat([raw, new_rows], ignore_index=True)
+
+def test_full_export_matches_clean_data(tmp_path):
+    raw_path, cache_dir = str(tmp_path / 'raw.csv'), str(tmp_path / 'cache')
+    raw = generate_chunk(0, ROWS)
+    raw.to_csv(raw_path, index=False)
+    cleaned_data = load_cleaned_data(raw_path, cache_dir, incremental=True)
+    load_crime_cube(cleaned_data, cache_dir)
+
+    changed_raw_data(raw).to_csv(raw_path, index=False)
+    refreshed = load_cleaned_data(raw_path, cache_dir, incremental=True)
+    expected = clean_data(raw_path)
+
+    assert read_manifest(cache_dir)['last_delta']['retracted_rows'] == 100
+    pd.testing.assert_frame_equal(comparable(refreshed), comparable(expected))
+    pd.testing.assert_frame_equal(comparable_counts(load_crime_cube(refreshed, cache_dir)), comparable_counts(build_crime_cube(expected)))
+
+    # the refreshed cache is valid for the new export and loads the same crimes again
+    pd.testing.assert_frame_equal(comparable(load_cleaned_data(raw_path, cache_dir, incremental=True)), comparable(expected))
+
+def test_delta_file_keeps_missing_rows(tmp_path):
+    raw_path, delta_path, cache_dir = str(tmp_path / 'raw.csv'), str(tmp_path / 'delta.csv'), str(tmp_path / 'cache')
+    raw = generate_chunk(0, ROWS)
+    raw.to_csv(raw_path, index=False)
+    load_cleaned_data(raw_path, cache_dir, incremental=True)
+
+    # a delta file only holds the changed and new rows, the rows missing from it stay in the cache
+    changed = changed_raw_data(raw)
+    delta = changed[changed['RowID'].isin(raw.loc[100:219, 'RowID']) | (changed['RowID'] > raw['RowID'].max())]
+    delta.to_csv(delta_path, index=False)
+    refreshed = apply_delta(delta_path, cache_dir)
+
+    # the full data with the delta applied is the changed data with the retracted rows put back
+    full = pd.concat([changed, raw.loc[300:399]], ignore_index=True)
+    full.to_csv(raw_path, index=False)
+    assert read_manifest(cache_dir)['last_delta']['retracted_rows'] == 0
+    pd.testing.assert_frame_equal(comparable(refreshed), comparable(clean_data(raw_path)))